@@ -0,0 +1,49 @@
+// FitCsvWorker.java
+// Long-lived wrapper around FitCSVTool.jar: runs CSVTool conversions sent over
+// stdin so a single warm JVM serves many files. Started by csvtool_worker.py as
+//   java -cp FitCSVTool.jar FitCsvWorker.java
+//
+// Protocol: one request per line, fields separated by TAB.
+//   PING                 -> PONG
+//   RUN <arg> <arg> ...  -> OK | ERR <message>   (args as for FitCSVTool.jar)
+//   QUIT                 -> worker exits
+
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
+
+public class FitCsvWorker {
+    public static void main(String[] argv) throws IOException {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        // CSVTool reports progress on System.out; keep it off the protocol channel
+        System.setOut(System.err);
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t", -1);
+            switch (parts[0]) {
+                case "PING":
+                    protocol.println("PONG");
+                    break;
+                case "QUIT":
+                    return;
+                case "RUN":
+                    try {
+                        com.garmin.fit.csv.CSVTool.main(Arrays.copyOfRange(parts, 1, parts.length));
+                        protocol.println("OK");
+                    } catch (Throwable t) {
+                        protocol.println("ERR " + String.valueOf(t).replace('\n', ' '));
+                    }
+                    break;
+                default:
+                    protocol.println("ERR unknown command " + parts[0]);
+            }
+        }
+    }
+}
@@ -0,0 +1,245 @@
+"""
+Clock alignment between a Polar KDF recording and a Garmin FIT activity.
+
+The two devices keep their own clocks: the KDF start time can be seconds
+off the FIT timestamps and the difference drifts over long sessions. Heart
+rate derived from the RR intervals is cross-correlated (by FFT, on a
+uniform grid) against the FIT `heart_rate` column, first over the whole
+session and then in windows; a line through the window offsets gives the
+offset and the linear drift:
+
+    alignment = estimate_alignment(fit_times, fit_hr, rr_times, rr_ms)
+    merged = sync_rr_to_fit_cpp(fit_records, rri, alignment=alignment)
+
+All times are POSIX seconds.
+"""
+from collections import namedtuple
+import numpy as np
+
+DEFAULT_RATE = 1.0          # Hz, resampling grid
+DEFAULT_MAX_LAG = 300.0     # s, search range for the whole-session offset
+DEFAULT_WINDOW = 1800.0     # s, length of the windows fitted for drift
+DEFAULT_LOCAL_LAG = 30.0    # s, search range around the whole-session offset per window
+DETREND_SECONDS = 120.0     # slow HR trends are removed before correlating
+MAX_GAP = 10.0              # s, no interpolation across longer gaps (pauses, dropouts)
+MIN_SCORE = 0.3             # a session (or window) correlating worse than this is not trusted
+MIN_WINDOWS = 3             # fewer usable windows: offset only, no drift
+MIN_OVERLAP = 0.5           # share of a window (or the session) that must overlap
+HR_RANGE = (25.0, 240.0)    # bpm, RR-derived HR outside this is treated as artifact
+
+AlignmentWindow = namedtuple('AlignmentWindow', ['center', 'offset', 'score', 'used'])
+AlignmentWindow.__doc__ = """
+One window of the drift fit: its center (FIT time), the offset (s) found
+there, the correlation score at that offset and whether the fit used it.
+"""
+
+
+class AlignmentRejected(ValueError):
+    """
+    The heart-rate signals correlate too poorly (score below MIN_SCORE) for
+    the offset to be trusted; the rejected estimate is kept as .alignment.
+    """
+
+    def __init__(self, alignment):
+        super().__init__(f"Heart rate correlates too poorly to align the clocks ({alignment!r}).")
+        self.alignment = alignment
+
+
+class ClockAlignment:
+    """
+    offset(t) = offset + drift * (t - t0): seconds to add to a KDF time t
+    to get the FIT time of the same moment. score is the whole-session
+    correlation at the offset (1.0 is a perfect match).
+    """
+
+    def __init__(self, offset, drift=0.0, t0=0.0, score=float('nan'), windows=()):
+        self.offset = float(offset)
+        self.drift = float(drift)
+        self.t0 = float(t0)
+        self.score = float(score)
+        self.windows = list(windows)
+
+    def offset_at(self, t):
+        return self.offset + self.drift * (np.asarray(t, dtype=np.double) - self.t0)
+
+    def correct(self, rr_times):
+        """KDF POSIX times moved onto the FIT clock."""
+        rr_times = np.asarray(rr_times, dtype=np.double)
+        return rr_times + self.offset_at(rr_times)
+
+    def __repr__(self):
+        return (f"ClockAlignment(offset={self.offset:.3f}s, drift={self.drift * 1e6:.1f}ppm, "
+                f"score={self.score:.3f}, windows={sum(w.used for w in self.windows)}/{len(self.windows)})")
+
+
+def rr_heart_rate(rr_times, rr_ms):
+    """
+    Instantaneous heart rate (bpm) of each beat, placed at the middle of
+    its interval (an RR time marks the interval's end), with artifacts
+    (outside HR_RANGE) dropped. Returns (times, bpm).
+    """
+    rr_times = np.asarray(rr_times, dtype=np.double)
+    rr_ms = np.asarray(rr_ms, dtype=np.double)
+    with np.errstate(divide='ignore'):
+        bpm = 60000.0 / rr_ms
+    keep = (bpm >= HR_RANGE[0]) & (bpm <= HR_RANGE[1])
+    return rr_times[keep] - rr_ms[keep] / 2000.0, bpm[keep]
+
+
+def _resample(times, values, grid):
+    """
+    Linear interpolation of (times, values) onto grid; grid points outside
+    the samples or inside a gap longer than MAX_GAP are invalid.
+    Returns (values, valid mask).
+    """
+    keep = np.isfinite(values)
+    times, values = times[keep], values[keep]
+    out = np.zeros(grid.size)
+    valid = np.zeros(grid.size, dtype=bool)
+    if times.size < 2:
+        return out, valid
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    k = np.searchsorted(times, grid, side='right')
+    inside = (k > 0) & (k < times.size)
+    gap = np.full(grid.size, np.inf)
+    gap[inside] = times[k[inside]] - times[k[inside] - 1]
+    valid = inside & (gap <= MAX_GAP)
+    out[valid] = np.interp(grid[valid], times, values)
+    return out, valid
+
+
+def _normalize(values, valid, rate):
+    """High-passes (minus a moving mean) and standardizes the valid samples; invalid ones become 0."""
+    width = max(1, int(round(DETREND_SECONDS * rate)))
+    kernel = np.ones(width)
+    weight = np.convolve(valid.astype(np.double), kernel, mode='same')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        trend = np.convolve(np.where(valid, values, 0.0), kernel, mode='same') / weight
+    x = np.where(valid, values - trend, 0.0)
+    if valid.sum() > 1:
+        std = x[valid].std()
+        if std > 0:
+            x[valid] = (x[valid] - x[valid].mean()) / std
+    return np.where(valid, x, 0.0)
+
+
+def _xcorr(f, f_valid, h, h_valid, max_lag):
+    """
+    Normalized cross-correlation by FFT: score[k] ~ mean of f[t + k] * h[t]
+    over the samples where both are valid, for lags -max_lag..max_lag.
+    Returns (lags, score, overlap counts).
+    """
+    n = f.size + h.size
+    nfft = 1 << int(np.ceil(np.log2(max(n, 2))))
+    F = np.fft.rfft(f, nfft)
+    H = np.fft.rfft(h, nfft)
+    Fm = np.fft.rfft(f_valid.astype(np.double), nfft)
+    Hm = np.fft.rfft(h_valid.astype(np.double), nfft)
+    corr = np.fft.irfft(F * np.conj(H), nfft)
+    count = np.rint(np.fft.irfft(Fm * np.conj(Hm), nfft))
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr, count = corr[lags % nfft], count[lags % nfft]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = np.where(count > 0, corr / count, -np.inf)
+    return lags, score, count
+
+
+def _peak(lags, score, count, min_count):
+    """Lag (fractional, by parabolic interpolation) and score of the best-correlating lag."""
+    score = np.where(count >= min_count, score, -np.inf)
+    i = int(np.argmax(score))
+    best = score[i]
+    if not np.isfinite(best):
+        return None, -np.inf
+    shift = 0.0
+    if 0 < i < score.size - 1 and np.isfinite(score[i - 1]) and np.isfinite(score[i + 1]):
+        denom = score[i - 1] - 2 * best + score[i + 1]
+        if denom < 0:
+            shift = 0.5 * (score[i - 1] - score[i + 1]) / denom
+    return lags[i] + shift, best
+
+
+def estimate_alignment(fit_times, fit_hr, rr_times, rr_ms,
+                       max_lag=DEFAULT_MAX_LAG, window=DEFAULT_WINDOW,
+                       local_lag=DEFAULT_LOCAL_LAG, rate=DEFAULT_RATE):
+    """
+    Estimates the KDF -> FIT clock offset and drift from heart rate.
+
+    fit_times/fit_hr: FIT record POSIX times and heart_rate (NaN where missing)
+    rr_times/rr_ms:   RR interval POSIX times (KDF clock) and values (ms)
+    max_lag:   largest whole-session offset considered (s)
+    window:    window length for the drift fit (s); None fits the offset only
+    local_lag: search range around the session offset in each window (s)
+
+    Raises ValueError when the heart-rate signals do not overlap enough to
+    correlate at all, and AlignmentRejected (a ValueError) when their best
+    whole-session correlation is below MIN_SCORE.
+    """
+    fit_times = np.asarray(fit_times, dtype=np.double)
+    fit_hr = np.asarray(fit_hr, dtype=np.double)
+    beat_times, beat_hr = rr_heart_rate(rr_times, rr_ms)
+    if not np.isfinite(fit_hr).any() or beat_times.size < 2:
+        raise ValueError("Heart rate is needed from both the FIT and the KDF file to align them.")
+
+    # One grid covers both recordings plus the search range
+    start = min(fit_times.min(), beat_times.min()) - max_lag
+    stop = max(fit_times.max(), beat_times.max()) + max_lag
+    grid = start + np.arange(int((stop - start) * rate) + 1) / rate
+    f, f_valid = _resample(fit_times, fit_hr, grid)
+    h, h_valid = _resample(beat_times, beat_hr, grid)
+    f = _normalize(f, f_valid, rate)
+    h = _normalize(h, h_valid, rate)
+
+    # Whole session
+    max_k = int(round(max_lag * rate))
+    min_count = MIN_OVERLAP * min(f_valid.sum(), h_valid.sum())
+    lag, score = _peak(*_xcorr(f, f_valid, h, h_valid, max_k), min_count)
+    if lag is None:
+        raise ValueError("FIT and KDF heart rate do not overlap enough to align them.")
+    offset = lag / rate
+    t0 = float(fit_times.min())
+    if score < MIN_SCORE:
+        raise AlignmentRejected(ClockAlignment(offset, 0.0, t0, score))
+    if not window:
+        return ClockAlignment(offset, 0.0, t0, score)
+
+    # Windows: the offset is searched only near the whole-session one
+    win = int(round(window * rate))
+    local_k = int(round(local_lag * rate))
+    base_k = int(round(lag))
+    reach = abs(base_k) + local_k
+    windows = []
+    for a in range(0, grid.size, win):
+        b = min(a + win, grid.size)
+        if f_valid[a:b].sum() < MIN_OVERLAP * win:
+            continue
+        lo, hi = max(a - reach, 0), min(b + reach, grid.size)
+        fw = np.zeros(hi - lo)
+        fw_valid = np.zeros(hi - lo, dtype=bool)
+        fw[a - lo:b - lo] = f[a:b]
+        fw_valid[a - lo:b - lo] = f_valid[a:b]
+        lags, scores, counts = _xcorr(fw, fw_valid, h[lo:hi], h_valid[lo:hi], reach)
+        near = np.abs(lags - base_k) <= local_k
+        w_lag, w_score = _peak(lags[near], scores[near], counts[near], MIN_OVERLAP * f_valid[a:b].sum())
+        if w_lag is not None:
+            windows.append(AlignmentWindow(float(grid[(a + b - 1) // 2]), w_lag / rate, float(w_score), False))
+
+    good = [i for i, w in enumerate(windows) if w.score >= MIN_SCORE]
+    if len(good) < MIN_WINDOWS:
+        return ClockAlignment(offset, 0.0, t0, score, windows)
+
+    # Weighted line through the window offsets, refitted once without outliers (beyond 3 MADs)
+    centers = np.array([windows[i].center for i in good]) - t0
+    offsets = np.array([windows[i].offset for i in good])
+    weights = np.array([windows[i].score for i in good])
+    drift, intercept = np.polyfit(centers, offsets, 1, w=weights)
+    residual = np.abs(offsets - (intercept + drift * centers))
+    keep = residual <= 3 * np.median(residual) + 1.0 / rate
+    if 2 <= keep.sum() < keep.size:
+        drift, intercept = np.polyfit(centers[keep], offsets[keep], 1, w=weights[keep])
+    else:
+        keep[:] = True
+    for i, k in zip(good, keep):
+        windows[i] = windows[i]._replace(used=bool(k))
+    return ClockAlignment(float(intercept), float(drift), t0, score, windows)
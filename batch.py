@@ -0,0 +1,274 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from instrument import FORMATS, configure, context, enabled, stage
+from progress import NULL_PROGRESS, ProgressReporter, metrics_sink
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+
+STATE_FILE = '.batch_state.jsonl'
+REPORT_FILE = 'batch_report.json'
+
+
+def run_sync_job(fit_path, kdf_path, output_fit, stream=False, align=False, hrv=False):
+    """
+    Headless parse -> sync -> write for one FIT/KDF pair. Runs in a pool
+    worker; the output is written under a temporary name and moved into
+    place only once complete. stream=True syncs and writes chunk by chunk,
+    keeping memory bounded for very long recordings. align=True corrects
+    the KDF clock offset and drift from heart rate first (not with stream).
+    hrv=True adds rolling HRV metrics to the records (not with stream).
+    """
+    if stream and align:
+        raise ValueError("Clock alignment needs the whole recording; it cannot be combined with stream.")
+    if stream and hrv:
+        raise ValueError("HRV metrics need the whole recording; they cannot be combined with stream.")
+    with context(job=str(output_fit)), stage('job', stream=stream) as s:
+        if stream:
+            result = _run_stream_job(fit_path, kdf_path, output_fit)
+        else:
+            result = _run_sync_job(fit_path, kdf_path, output_fit, align, hrv)
+        s.count(records=result['records'], rr_intervals=result['rr_intervals'])
+    return result
+
+
+def _run_sync_job(fit_path, kdf_path, output_fit, align=False, hrv=False):
+    from core import sync_files
+
+    start = time.perf_counter()
+    Path(output_fit).parent.mkdir(parents=True, exist_ok=True)
+    partial = output_fit + '.part'
+    # Stage progress goes out with the metrics, once a second at most
+    progress = ProgressReporter(metrics_sink, interval=1.0) if enabled() else NULL_PROGRESS
+    # Parses are cached by content hash, so retries and re-runs skip them
+    try:
+        merged = sync_files(fit_path, kdf_path, partial, progress=progress, align=align, hrv=hrv)
+        os.replace(partial, output_fit)
+    except BaseException:
+        _remove(partial)
+        raise
+    result = {
+        'records': int(merged.fit_records['timestamp'].size),
+        'rr_intervals': len(merged),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    if merged.alignment is not None:
+        result.update(clock_offset_s=round(merged.alignment.offset, 3),
+                      clock_drift_ppm=round(merged.alignment.drift * 1e6, 2))
+    if merged.alignment_rejected is not None:
+        result.update(alignment_rejected=True, alignment_score=round(merged.alignment_rejected.score, 3))
+    if merged.hrv_columns is not None:
+        import numpy as np
+
+        rmssd = merged.hrv_columns['rmssd']
+        if np.isfinite(rmssd).any():
+            result['median_rmssd_ms'] = round(float(np.nanmedian(rmssd)), 2)
+    return result
+
+
+def _run_stream_job(fit_path, kdf_path, output_fit):
+    from core import iter_fit_timestamps, iter_kdf_chunks, sync_rr_to_fit_stream, write_fit_with_hrv_stream
+
+    start = time.perf_counter()
+    Path(output_fit).parent.mkdir(parents=True, exist_ok=True)
+    partial = output_fit + '.part'
+    batches = sync_rr_to_fit_stream(iter_fit_timestamps(fit_path), iter_kdf_chunks(kdf_path, 'RRI'))
+    try:
+        records, rr_intervals = write_fit_with_hrv_stream(fit_path, batches, partial)
+        os.replace(partial, output_fit)
+    except BaseException:
+        _remove(partial)
+        raise
+    return {
+        'records': records,
+        'rr_intervals': rr_intervals,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def jobs_from_dir(directory, out_dir=None):
+    """Pairs every <name>.fit in directory with <name>.kdf."""
+    directory = Path(directory)
+    kdfs = {p.stem: p for p in directory.iterdir() if p.suffix.lower() == '.kdf'}
+    jobs = []
+    for fit in sorted(p for p in directory.iterdir() if p.suffix.lower() == '.fit'):
+        kdf = kdfs.get(fit.stem)
+        if kdf is None:
+            print(f"[skip] {fit.name}: no matching .kdf")
+            continue
+        jobs.append(_job(fit, kdf, None, out_dir))
+    return jobs
+
+
+def jobs_from_manifest(manifest, out_dir=None):
+    """
+    Reads jobs from a CSV (columns fit, kdf[, output]) or JSON (list of
+    objects with the same keys) manifest. Relative paths are relative to the
+    manifest.
+    """
+    manifest = Path(manifest)
+    if manifest.suffix.lower() == '.json':
+        with open(manifest) as f:
+            rows = json.load(f)
+    else:
+        with open(manifest, newline='') as f:
+            rows = list(csv.DictReader(f))
+    base = manifest.parent
+    return [
+        _job(base / row['fit'], base / row['kdf'], row.get('output') and base / row['output'], out_dir)
+        for row in rows
+    ]
+
+
+def _job(fit, kdf, output, out_dir):
+    fit = Path(fit)
+    if not output:
+        output = Path(out_dir or fit.parent) / f"{fit.stem}_rr.fit"
+    return {'id': str(output), 'fit': str(fit), 'kdf': str(kdf), 'output': str(output)}
+
+
+def load_state(state_path):
+    """Job id -> last journal entry, from a previous (possibly crashed) run."""
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                state[entry['id']] = entry
+    return state
+
+
+def run_batch(jobs, workers=None, state_path=None, force=False, stream=False, align=False, hrv=False):
+    """
+    Runs jobs on a process pool and returns their results. Each finished job
+    is appended to the state journal, so a re-run skips jobs that already
+    succeeded (unless force) and a crashed batch can be resumed.
+    """
+    state = {} if force or not state_path else load_state(state_path)
+    results = []
+    pending = []
+    for job in jobs:
+        done = state.get(job['id'])
+        if done and done['status'] == 'ok' and os.path.exists(job['output']):
+            results.append(dict(done, status='skipped'))
+            print(f"[skipped] {job['id']} (already done)")
+        else:
+            pending.append(job)
+
+    journal = open(state_path, 'a') if state_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {
+                pool.submit(run_sync_job, job['fit'], job['kdf'], job['output'], stream, align, hrv): job
+                for job in pending
+            }
+            for future in as_completed(futures):
+                job = futures[future]
+                entry = {'id': job['id'], 'fit': job['fit'], 'kdf': job['kdf'], 'output': job['output']}
+                try:
+                    entry.update(future.result(), status='ok')
+                    note = ', alignment rejected' if entry.get('alignment_rejected') else ''
+                    print(f"[ok] {job['id']} -> {job['output']} ({entry['rr_intervals']} RR, {entry['seconds']}s{note})")
+                except Exception as e:
+                    entry.update(status='failed', error=f"{type(e).__name__}: {e}")
+                    print(f"[failed] {job['id']}: {entry['error']}")
+                results.append(entry)
+                if journal:
+                    journal.write(json.dumps(entry) + '\n')
+                    journal.flush()
+                    os.fsync(journal.fileno())
+    finally:
+        if journal:
+            journal.close()
+    return results
+
+
+def summarize(results, seconds):
+    counts = {}
+    for r in results:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    return {
+        'jobs': len(results),
+        'ok': counts.get('ok', 0),
+        'skipped': counts.get('skipped', 0),
+        'failed': counts.get('failed', 0),
+        'seconds': round(seconds, 3),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='batch', description="Sync many Garmin FIT + Polar KDF pairs headlessly.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="directory of <name>.fit / <name>.kdf pairs")
+    source.add_argument('--manifest', help="CSV or JSON manifest with fit, kdf[, output]")
+    parser.add_argument('--out', help="output directory (default: next to each FIT file)")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument('--state', help=f"resume journal (default: <out>/{STATE_FILE})")
+    parser.add_argument('--report', help=f"summary report (default: <out>/{REPORT_FILE})")
+    parser.add_argument('--force', action='store_true', help="re-run jobs that already succeeded")
+    parser.add_argument('--stream', action='store_true', help="sync in chunks to bound memory on long recordings")
+    parser.add_argument('--align', action='store_true',
+                        help="correct the Polar clock offset/drift from heart rate before syncing")
+    parser.add_argument('--hrv', action='store_true',
+                        help="add rolling HRV metrics (RMSSD, SDNN, pNN50, LF/HF) to the records")
+    parser.add_argument('--metrics', choices=FORMATS, help="emit per-stage timing events in this format")
+    parser.add_argument('--metrics-file', help="append metrics events here (default: stderr)")
+    parser.add_argument('--trace-memory', action='store_true', help="add peak allocation per stage (slower)")
+    parser.add_argument('--profile-dir', help="write a cProfile dump per job into this directory")
+    args = parser.parse_args(argv)
+    if args.stream and args.align:
+        parser.error("--align needs the whole recording and cannot be combined with --stream")
+    if args.stream and args.hrv:
+        parser.error("--hrv needs the whole recording and cannot be combined with --stream")
+
+    if args.metrics:
+        # Exported so the pool workers, which run the stages, pick it up
+        configure(args.metrics, args.metrics_file, args.trace_memory, args.profile_dir, export=True)
+
+    try:
+        jobs = jobs_from_dir(args.dir, args.out) if args.dir else jobs_from_manifest(args.manifest, args.out)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not read jobs: {e}")
+        return EXIT_USAGE
+    if not jobs:
+        print("No FIT/KDF pairs found.")
+        return EXIT_USAGE
+
+    out_dir = Path(args.out or args.dir or Path(args.manifest).parent)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state_path = args.state or str(out_dir / STATE_FILE)
+    report_path = args.report or str(out_dir / REPORT_FILE)
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.workers, state_path, args.force, args.stream, args.align, args.hrv)
+    summary = summarize(results, time.perf_counter() - start)
+    with open(report_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"{summary['ok']} ok, {summary['skipped']} skipped, {summary['failed']} failed "
+          f"in {summary['seconds']}s; report: {report_path}")
+    return EXIT_FAILURES if summary['failed'] else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
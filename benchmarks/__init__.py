@@ -0,0 +1,6 @@
+"""
+Benchmarks for the parse -> sync -> write pipeline on synthetic data.
+
+    python -m benchmarks.run --case single-1h --case multisport-4h
+    python -m benchmarks.sync_backends    # native vs NumPy sync parity
+"""
@@ -0,0 +1,84 @@
+"""
+Checks of the clock alignment (align.estimate_alignment) on synthetic
+inputs: a known KDF clock offset is recovered, and a KDF whose heart rate
+does not follow the activity is rejected and synced without any shift.
+
+    python -m benchmarks.alignment
+    python -m benchmarks.alignment --hours 4 --offset -42
+
+The exit code is 1 when a check fails.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.synthetic import make_fit, make_kdf
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+DEFAULT_HOURS = 2.0
+DEFAULT_OFFSET = 12.5       # s, KDF clock ahead of the FIT clock
+TOLERANCE_S = 1.0           # largest accepted error of the recovered offset
+UNRELATED_SEED = 1          # heart rate unrelated to the activity's (seed 0)
+
+
+def _inputs(data_dir, hours, offset):
+    fit_path = os.path.join(data_dir, f'align-{hours:g}h.fit')
+    shifted = os.path.join(data_dir, f'align-{hours:g}h-offset{offset:g}.kdf')
+    unrelated = os.path.join(data_dir, f'align-{hours:g}h-seed{UNRELATED_SEED}.kdf')
+    # Only the RRI channel is needed; the ECG/ACC channels are kept tiny
+    make_fit(fit_path, hours)
+    make_kdf(shifted, hours, offset_s=offset, ecg_hz=1, acc_hz=1)
+    make_kdf(unrelated, hours, seed=UNRELATED_SEED, ecg_hz=1, acc_hz=1)
+    return fit_path, shifted, unrelated
+
+
+def check_offset(fit_path, kdf_path, offset):
+    """The offset of a shifted KDF is found and applied."""
+    from core import sync_files
+
+    merged = sync_files(fit_path, kdf_path, align=True)
+    alignment = merged.alignment
+    ok = alignment is not None and abs(alignment.offset + offset) <= TOLERANCE_S
+    print(f"  offset      expected {-offset:.3f}s  got {alignment!r}  {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def check_rejected(fit_path, kdf_path):
+    """An unrelated KDF gives no alignment, and the sync matches the unaligned one."""
+    from core import sync_files
+
+    merged = sync_files(fit_path, kdf_path, align=True)
+    plain = sync_files(fit_path, kdf_path)
+    ok = (merged.alignment is None and merged.alignment_rejected is not None
+          and np.array_equal(merged.fit_index, plain.fit_index)
+          and np.array_equal(merged.rr_time, plain.rr_time))
+    print(f"  unrelated   rejected {merged.alignment_rejected!r}  {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.alignment', description="Check the clock alignment.")
+    parser.add_argument('--hours', type=float, default=DEFAULT_HOURS, help="activity length (default: 2)")
+    parser.add_argument('--offset', type=float, default=DEFAULT_OFFSET,
+                        help=f"KDF clock offset to recover, in seconds (default: {DEFAULT_OFFSET})")
+    parser.add_argument('--data-dir', help="where synthetic inputs are generated")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), 'polar_garmin_bench')
+    os.makedirs(data_dir, exist_ok=True)
+    fit_path, shifted, unrelated = _inputs(data_dir, args.hours, args.offset)
+
+    print(f"align-{args.hours:g}h:")
+    ok = check_offset(fit_path, shifted, args.offset)
+    ok &= check_rejected(fit_path, unrelated)
+    print("Alignment checks passed." if ok else "Alignment checks FAILED.")
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
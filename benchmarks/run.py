@@ -0,0 +1,231 @@
+"""
+Times every pipeline stage on synthetic inputs and records peak memory.
+
+    python -m benchmarks.run                           # default cases
+    python -m benchmarks.run --case multisport-24h --out results.json
+    python -m benchmarks.run --baseline baseline.json  # flag slowdowns
+
+Each stage is run --repeat times for timing (best and median are kept) and
+once more under tracemalloc for its peak allocation. Results are JSON; with
+--baseline, stages slower (or hungrier) than threshold x baseline are
+reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.synthetic import GENERATOR_VERSION, TRIATHLON, make_fit, make_kdf
+
+RESULTS_VERSION = 1
+EXIT_OK = 0
+EXIT_REGRESSIONS = 1
+
+# case name -> (hours, legs)
+CASES = {
+    'single-1h':      (1, ('running',)),
+    'single-4h':      (4, ('cycling',)),
+    'single-24h':     (24, ('running',)),
+    'multisport-1h':  (1, TRIATHLON),
+    'multisport-4h':  (4, TRIATHLON),
+    'multisport-12h': (12, TRIATHLON),
+    'multisport-24h': (24, TRIATHLON),
+}
+DEFAULT_CASES = ('single-1h', 'multisport-1h')
+
+
+def measure(fn, repeat):
+    """Best/median wall time over repeat runs, then peak traced memory of one more run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': round(min(times), 6),
+        'median_seconds': round(statistics.median(times), 6),
+        'peak_mb': round(peak / 2 ** 20, 3),
+    }
+
+
+def stages(fit_path, kdf_path, out_dir):
+    """
+    (name, callable) per stage. Imports happen here so a stage whose module
+    cannot load on this platform is reported as skipped, not fatal.
+    """
+    from parser_fit import parse_fit_file, parse_fit_columns
+    from parser_kdf import parse_kdf_file, parse_kdf_columns
+    from divider import ParsedActivity, split_multisport_fit
+    from writer_fit import write_fit_with_hrv, write_fit_with_rr, write_split_fits_pure_python
+
+    yield 'parse_kdf_file', lambda: parse_kdf_file(kdf_path)
+    yield 'parse_kdf_columns', lambda: parse_kdf_columns(kdf_path, ['RRI'])
+    yield 'parse_fit_file', lambda: parse_fit_file(fit_path)
+    yield 'parse_fit_columns', lambda: parse_fit_columns(fit_path, ('timestamp', 'heart_rate'))
+    yield 'split_multisport_fit', lambda: split_multisport_fit(fit_path)
+    yield 'parsed_activity', lambda: ParsedActivity(fit_path)
+    # What ParsedActivity cost when it decoded with fit_tool; the legacy encoder still pays it once
+    yield 'parsed_activity_fit_tool', lambda: ParsedActivity(fit_path).records
+
+    activity = ParsedActivity(fit_path)
+    split_out = str(Path(out_dir) / 'split.fit')
+    yield 'write_split_fit_tool', lambda: write_split_fits_pure_python(
+        fit_path, split_out, activity=activity, workers=1)
+    yield 'write_split_fit_tool_parallel', lambda: write_split_fits_pure_python(
+        fit_path, split_out, activity=activity)
+    yield 'write_split_fast', lambda: write_split_fits_pure_python(
+        fit_path, split_out, activity=activity, encoder='fast')
+
+    from sync import sync_rr_to_fit_cpp
+    fit_columns = parse_fit_columns(fit_path, ('timestamp',))
+    rri = parse_kdf_columns(kdf_path, ['RRI'])['RRI']
+    yield 'sync_rr_to_fit_cpp', lambda: sync_rr_to_fit_cpp(fit_columns, rri)
+
+    merged = sync_rr_to_fit_cpp(fit_columns, rri)
+    hrv_out = str(Path(out_dir) / 'hrv.fit')
+    yield 'write_fit_with_hrv', lambda: write_fit_with_hrv(fit_path, merged, hrv_out)
+
+    jar = Path(__file__).resolve().parent.parent / 'FitCSVTool.jar'
+    if shutil.which('java') and jar.exists():
+        legacy = sync_rr_to_fit_cpp(parse_fit_file(fit_path), parse_kdf_file(kdf_path)['RRI']['data'])
+        rr_out = str(Path(out_dir) / 'rr.fit')
+        yield 'write_fit_with_rr', lambda: write_fit_with_rr(fit_path, legacy, str(jar), rr_out)
+
+
+def case_inputs(name, data_dir):
+    """
+    (fit_path, kdf_path) of a case, generated on first use. Inputs are
+    deterministic, so files from an earlier run of the same generator
+    version are reused; the version is part of the file names.
+    """
+    hours, legs = CASES[name]
+    fit_path = os.path.join(data_dir, f'{name}-v{GENERATOR_VERSION}.fit')
+    kdf_path = os.path.join(data_dir, f'{name}-v{GENERATOR_VERSION}.kdf')
+    if not os.path.exists(fit_path):
+        make_fit(fit_path, hours, legs)
+    if not os.path.exists(kdf_path):
+        make_kdf(kdf_path, hours)
+    return fit_path, kdf_path
+
+
+def run_case(name, data_dir, repeat, only=None):
+    hours, legs = CASES[name]
+    fit_path, kdf_path = case_inputs(name, data_dir)
+
+    results = {'_inputs': {'hours': hours, 'legs': list(legs), 'generator_version': GENERATOR_VERSION,
+                           'fit_bytes': os.path.getsize(fit_path), 'kdf_bytes': os.path.getsize(kdf_path)}}
+    with tempfile.TemporaryDirectory() as out_dir:
+        iterator = stages(fit_path, kdf_path, out_dir)
+        while True:
+            try:
+                stage, fn = next(iterator)
+            except StopIteration:
+                break
+            except (ImportError, OSError) as e:
+                # e.g. a native library not built for this platform: later stages need it
+                results['_skipped'] = f"{type(e).__name__}: {e}"
+                print(f"  remaining stages skipped: {results['_skipped']}")
+                break
+            if only and stage not in only:
+                continue
+            results[stage] = measure(fn, repeat)
+            r = results[stage]
+            print(f"  {stage:<32} {r['seconds']:>9.4f}s  {r['peak_mb']:>9.1f} MB")
+    return results
+
+
+def environment():
+    import numpy
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Stages whose time or peak memory exceeds threshold x baseline."""
+    regressions = []
+    for case, stages_ in results['results'].items():
+        base_case = baseline.get('results', {}).get(case, {})
+        for stage, r in stages_.items():
+            base = base_case.get(stage)
+            if stage.startswith('_') or not base:
+                continue
+            for metric in ('seconds', 'peak_mb'):
+                if base[metric] > 0 and r[metric] > threshold * base[metric]:
+                    regressions.append({'case': case, 'stage': stage, 'metric': metric,
+                                        'baseline': base[metric], 'current': r[metric],
+                                        'ratio': round(r[metric] / base[metric], 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.run', description="Benchmark the sync/split pipeline.")
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help=f"case to run (repeatable; default: {', '.join(DEFAULT_CASES)})")
+    parser.add_argument('--stage', action='append', help="only run this stage (repeatable)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage (default: 3)")
+    parser.add_argument('--data-dir', help="where synthetic inputs are generated and reused")
+    parser.add_argument('--out', help="write results JSON here")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="flag stages above threshold x baseline (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), 'polar_garmin_bench')
+    os.makedirs(data_dir, exist_ok=True)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for case in args.case or DEFAULT_CASES:
+        print(f"{case}:")
+        results['results'][case] = run_case(case, data_dir, args.repeat, args.stage)
+
+    status = EXIT_OK
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results['regressions'] = regressions
+        for r in regressions:
+            print(f"SLOWER {r['case']}/{r['stage']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']} (x{r['ratio']})")
+        if regressions:
+            status = EXIT_REGRESSIONS
+        else:
+            print(f"No stage above {args.threshold}x baseline.")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results: {args.out}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
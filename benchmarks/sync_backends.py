@@ -0,0 +1,171 @@
+"""
+Parity and speed of the sync backends: the native library (sync.cpp, built
+with `make libsync.so` or shipped as sync.dll) against the NumPy fallback.
+
+    python -m benchmarks.sync_backends                     # single-1h, single-24h
+    python -m benchmarks.sync_backends --require-native    # CI: fail without the library
+
+Every check runs on both backends; the matched FIT and RR indices must be
+identical. The exit code is 1 on any mismatch (or a missing library with
+--require-native).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import sync
+from benchmarks.run import CASES, case_inputs
+
+EXIT_OK = 0
+EXIT_MISMATCH = 1
+
+DEFAULT_CASES = ('single-1h', 'single-24h')
+TOLERANCE_S = 1.0
+
+
+def _edge_inputs(seed=0):
+    """
+    Small list-of-dict inputs with the awkward spots: duplicate FIT
+    timestamps, a pause, RR exactly between two records and RR before the
+    first / after the last record.
+    """
+    rng = np.random.default_rng(seed)
+    t0 = datetime(2024, 5, 1, 8, 0, 0, tzinfo=timezone.utc)
+    seconds = np.concatenate((np.arange(600), np.arange(900, 1500)))     # 5 min pause
+    seconds = np.sort(np.concatenate((seconds, rng.choice(seconds, 40))))  # duplicates
+    fit = [{'timestamp': t0 + timedelta(seconds=int(s))} for s in seconds]
+    rr_s = np.sort(np.concatenate((
+        rng.uniform(-5, 1505, 3000),
+        np.arange(0, 1500, 7) + 0.5,          # ties between neighbouring records
+        seconds[::50].astype(np.double),      # exactly on (duplicated) records
+    )))
+    rri = [{'timestamp': t0 + timedelta(seconds=float(s)), 'value': 800} for s in rr_s]
+    return fit, rri
+
+
+def _indices(result):
+    return result.fit_index.astype(np.int64), np.asarray(result.rr_index, dtype=np.int64)
+
+
+def _concat_stream(batches):
+    batches = list(batches)
+    if not batches:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return (np.concatenate([b.fit_index for b in batches]).astype(np.int64),
+            np.concatenate([b.rr_index for b in batches]).astype(np.int64))
+
+
+def checks(fit_path, kdf_path):
+    """(name, fn(backend) -> (fit_index, rr_index)) per check."""
+    from parser_fit import fit_posix_times, iter_fit_timestamps, parse_fit_columns
+    from parser_kdf import iter_kdf_chunks, parse_kdf_columns, channel_posix_times
+
+    fit_columns = parse_fit_columns(fit_path, ('timestamp',))
+    rri = parse_kdf_columns(kdf_path, ['RRI'])['RRI']
+    yield 'nearest', lambda b: _indices(sync.sync_rr_to_fit_cpp(fit_columns, rri, backend=b))
+    yield 'tolerance', lambda b: _indices(
+        sync.sync_rr_to_fit_cpp(fit_columns, rri, max_tolerance=TOLERANCE_S, backend=b))
+
+    rr_times = channel_posix_times(rri)
+    shuffled = rr_times[np.random.default_rng(0).permutation(rr_times.size)]
+    fit_times = fit_posix_times(fit_columns)
+
+    def unsorted(b):
+        out_idx, matched = sync.sync_rr_to_fit_matched(shuffled, fit_times, TOLERANCE_S, backend=b)
+        return out_idx.astype(np.int64), np.flatnonzero(matched)
+    yield 'unsorted_rr', unsorted
+
+    # The default (no tolerance) path with FIT records, then both series, out of order
+    fit_perm = np.random.default_rng(1).permutation(fit_times.size)
+    unsorted_fit = {'timestamp': fit_columns['timestamp'][fit_perm]}
+    rr_perm = np.random.default_rng(2).permutation(rr_times.size)
+    unsorted_rri = dict(rri, data=rri['data'][rr_perm], timestamps=rri['timestamps'][rr_perm])
+    yield 'unsorted_fit', lambda b: _indices(sync.sync_rr_to_fit_cpp(unsorted_fit, rri, backend=b))
+    yield 'unsorted_both', lambda b: _indices(sync.sync_rr_to_fit_cpp(unsorted_fit, unsorted_rri, backend=b))
+
+    yield 'stream', lambda b: _concat_stream(sync.sync_rr_to_fit_stream(
+        iter_fit_timestamps(fit_path, chunk_size=4096), iter_kdf_chunks(kdf_path, 'RRI', chunk_size=4096),
+        backend=b))
+
+
+def edge_checks():
+    fit, rri = _edge_inputs()
+    yield 'edges_nearest', lambda b: _indices(sync.sync_rr_to_fit_cpp(fit, rri, backend=b))
+    yield 'edges_tolerance', lambda b: _indices(
+        sync.sync_rr_to_fit_cpp(fit, rri, max_tolerance=TOLERANCE_S, backend=b))
+    yield 'edges_unsorted', lambda b: _indices(sync.sync_rr_to_fit_cpp(fit[::-1], rri[::-1], backend=b))
+    yield 'edges_stream', lambda b: _concat_stream(
+        sync.sync_rr_to_fit_stream(_chunks(fit), _chunks(rri), backend=b))
+
+
+def _chunks(rows, size=97):
+    return (rows[i:i + size] for i in range(0, len(rows), size))
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare_backends(name, fn, backends, repeat):
+    """Runs one check on every backend; returns False on a mismatch."""
+    reference = None
+    ok = True
+    timings = []
+    for backend in backends:
+        result = fn(backend)
+        if reference is None:
+            reference = result
+        elif not all(np.array_equal(a, b) for a, b in zip(reference, result)):
+            ok = False
+        timings.append(f"{backend} {best_time(lambda: fn(backend), repeat):.4f}s")
+    status = 'ok' if ok else 'MISMATCH'
+    print(f"  {name:<18} {reference[0].size:>9} rows  {'  '.join(timings)}  {status}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.sync_backends',
+                                     description="Compare the native and NumPy sync backends.")
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help=f"case to run (repeatable; default: {', '.join(DEFAULT_CASES)})")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per backend (default: 3)")
+    parser.add_argument('--data-dir', help="where synthetic inputs are generated and reused")
+    parser.add_argument('--require-native', action='store_true',
+                        help="fail when the native library is not available")
+    args = parser.parse_args(argv)
+
+    backends = [b for b in sync.BACKENDS if b != 'native' or sync._lib is not None]
+    if 'native' not in backends:
+        print("Native sync library not found; only the NumPy backend runs.")
+        if args.require_native:
+            return EXIT_MISMATCH
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), 'polar_garmin_bench')
+    os.makedirs(data_dir, exist_ok=True)
+
+    ok = True
+    print("edges:")
+    for name, fn in edge_checks():
+        ok &= compare_backends(name, fn, backends, args.repeat)
+    for case in args.case or DEFAULT_CASES:
+        fit_path, kdf_path = case_inputs(case, data_dir)
+        print(f"{case}:")
+        for name, fn in checks(fit_path, kdf_path):
+            ok &= compare_backends(name, fn, backends, args.repeat)
+
+    print("Backends agree." if ok else "Backends DIFFER.")
+    return EXIT_OK if ok else EXIT_MISMATCH
+
+
+if __name__ == "__main__":
+    sys.exit(main())
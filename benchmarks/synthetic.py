@@ -0,0 +1,146 @@
+"""
+Deterministic synthetic inputs: FIT activities (single sport or multisport,
+any length) and KDF recordings (RRI plus high-rate ECG/ACC channels) whose
+RR intervals follow the activity's heart rate. The same arguments always
+give byte-identical files.
+"""
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from fit_encoder import write_fit_file
+from fit_native import FIT_EPOCH
+
+START_TIME = datetime(2024, 5, 1, 8, 0, 0, tzinfo=timezone.utc)
+# Bumped whenever the generated files change, so inputs cached on disk are not reused
+GENERATOR_VERSION = 2
+
+# FIT profile enum values
+SPORTS = {'running': 1, 'cycling': 2, 'transition': 3, 'swimming': 5}
+EVENT_TIMER = 0
+EVENT_TYPE_START = 0
+EVENT_TYPE_STOP_ALL = 4
+FILE_TYPE_ACTIVITY = 4
+MANUFACTURER_DEVELOPMENT = 255
+
+TRIATHLON = ('swimming', 'transition', 'cycling', 'transition', 'running')
+# Share of the activity spent in each TRIATHLON leg (Ironman-like)
+TRIATHLON_SHARES = (0.11, 0.01, 0.55, 0.01, 0.32)
+
+# Record layouts: (field number, size, base type); power only while cycling
+_RECORD_FIELDS = [(253, 4, 0x86), (0, 4, 0x85), (1, 4, 0x85), (5, 4, 0x86),
+                  (78, 4, 0x86), (73, 4, 0x86), (3, 1, 0x02), (4, 1, 0x02)]
+_RECORD_DTYPE = [('header', 'u1'), ('timestamp', '<u4'), ('lat', '<i4'), ('long', '<i4'),
+                 ('distance', '<u4'), ('altitude', '<u4'), ('speed', '<u4'),
+                 ('heart_rate', 'u1'), ('cadence', 'u1')]
+
+
+def _definition(local_type, global_num, fields):
+    return (bytes([0x40 | local_type, 0, 0]) + struct.pack('<HB', global_num, len(fields))
+            + b''.join(bytes(f) for f in fields))
+
+
+def heart_rate_curve(seconds, seed=0):
+    """Per-second heart rate (bpm): warm-up, slow drift and smooth noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds, dtype=np.float64)
+    warmup = 40 * (1 - np.exp(-t / 300))
+    drift = 10 * t / max(seconds, 1)
+    noise = np.convolve(rng.normal(0, 3, seconds + 59), np.ones(60) / 60 * 8, mode='valid')[:seconds]
+    return np.clip(95 + warmup + drift + noise, 60, 195)
+
+
+def make_fit(path, hours=1.0, legs=('running',), seed=0):
+    """
+    Writes a 1 Hz activity of the given length. With several legs, each gets
+    a session message (multisport); triathlon legs use TRIATHLON_SHARES.
+    Returns the number of records.
+    """
+    seconds = int(hours * 3600)
+    rng = np.random.default_rng(seed)
+    t0 = int(START_TIME.timestamp()) - FIT_EPOCH
+
+    shares = TRIATHLON_SHARES if tuple(legs) == TRIATHLON else [1 / len(legs)] * len(legs)
+    bounds = np.round(np.cumsum((0,) + tuple(shares)) * seconds).astype(int)
+    bounds[-1] = seconds
+
+    hr = heart_rate_curve(seconds, seed)
+    speed = np.clip(3.0 + np.cumsum(rng.normal(0, 0.01, seconds)), 0.5, 15)
+    distance = np.cumsum(speed)
+    msgs = [_definition(0, 0, [(0, 1, 0x00), (1, 2, 0x84), (2, 2, 0x84), (4, 4, 0x86)]),
+            struct.pack('<BBHHI', 0, FILE_TYPE_ACTIVITY, MANUFACTURER_DEVELOPMENT, 0, t0),
+            _definition(1, 21, [(253, 4, 0x86), (0, 1, 0x00), (1, 1, 0x00)]),
+            struct.pack('<BIBB', 1, t0, EVENT_TIMER, EVENT_TYPE_START),
+            _definition(2, 20, _RECORD_FIELDS),
+            _definition(3, 20, _RECORD_FIELDS + [(7, 2, 0x84)])]
+
+    for leg, lo, hi in zip(legs, bounds[:-1], bounds[1:]):
+        n = hi - lo
+        cycling = leg == 'cycling'
+        dtype = _RECORD_DTYPE + ([('power', '<u2')] if cycling else [])
+        rows = np.zeros(n, dtype=dtype)
+        rows['header'] = 3 if cycling else 2
+        rows['timestamp'] = t0 + np.arange(lo, hi)
+        rows['lat'] = (45.0 + distance[lo:hi] * 1e-5) * 2 ** 31 / 180
+        rows['long'] = (7.0 + distance[lo:hi] * 5e-6) * 2 ** 31 / 180
+        rows['distance'] = distance[lo:hi] * 100
+        rows['altitude'] = (500 + 200 + 50 * np.sin(np.arange(lo, hi) / 600)) * 5
+        rows['speed'] = speed[lo:hi] * 1000
+        rows['heart_rate'] = hr[lo:hi]
+        rows['cadence'] = 85 + rng.integers(-5, 6, n)
+        if cycling:
+            rows['power'] = 180 + rng.integers(-40, 41, n)
+        msgs.append(rows.tobytes())
+
+    # Sessions close the file, as devices write them
+    msgs.append(_definition(4, 18, [(253, 4, 0x86), (2, 4, 0x86), (7, 4, 0x86), (5, 1, 0x00)]))
+    for leg, lo, hi in zip(legs, bounds[:-1], bounds[1:]):
+        msgs.append(struct.pack('<BIIIB', 4, t0 + hi, t0 + lo, (hi - lo) * 1000, SPORTS[leg]))
+    msgs.append(struct.pack('<BIBB', 1, t0 + seconds, EVENT_TIMER, EVENT_TYPE_STOP_ALL))
+    write_fit_file(path, msgs)
+    return seconds
+
+
+def make_kdf(path, hours=1.0, seed=0, ecg_hz=130, acc_hz=50, offset_s=0.0):
+    """
+    Writes a KDF recording covering the activity: RR intervals (ms) derived
+    from heart_rate_curve with beat-to-beat variability, ECG (int16, ecg_hz)
+    and ACC (3 x int16, acc_hz) channels and a Markers list. offset_s shifts
+    the recording start against the activity start. Returns the RR count.
+    """
+    seconds = int(hours * 3600)
+    rng = np.random.default_rng(seed + 1)
+    hr = heart_rate_curve(seconds, seed)
+
+    # Beats where the cumulative heart rate crosses a whole beat, so the RR
+    # intervals follow the curve beat by beat; timing jitter does not accumulate
+    phase = np.concatenate(([0.0], np.cumsum(hr / 60)))
+    beats = np.interp(np.arange(1, int(phase[-1]) + 1), phase, np.arange(seconds + 1.0))
+    beats = np.sort(beats + rng.normal(0, 0.015, beats.size))
+    rr = np.round(np.diff(beats, prepend=0.0) * 1000).astype('<u2')
+
+    ecg_t = np.arange(seconds * ecg_hz) / ecg_hz
+    ecg = (800 * np.sin(2 * np.pi * 1.3 * ecg_t) ** 15 + rng.normal(0, 20, ecg_t.size)).astype('<i2')
+    acc = rng.integers(-1000, 1000, (seconds * acc_hz, 3)).astype('<i2')
+    markers = json.dumps([{'time': 0, 'label': 'start'}, {'time': seconds, 'label': 'stop'}]).encode()
+
+    blobs = [rr.tobytes(), ecg.tobytes(), acc.tobytes(), markers]
+    urls = np.cumsum([0] + [len(b) for b in blobs[:-1]]).tolist()
+    channels = [
+        {'label': 'RRI', 'type': 'RRI', 'data_enc': [['value', 'H']], 'total_values': int(rr.size)},
+        {'label': 'ECG', 'type': 'ECG', 'data_enc': [['value', 'h']], 'total_values': int(ecg.size),
+         'sample_rate': ecg_hz},
+        {'label': 'ACC', 'type': 'ACC', 'data_enc': [['x', 'h'], ['y', 'h'], ['z', 'h']],
+         'total_values': int(len(acc)), 'sample_rate': acc_hz},
+        {'label': 'Markers', 'type': 'MARKER', 'data_enc': 'list'},
+    ]
+    for channel, blob, url in zip(channels, blobs, urls):
+        channel.update(data_url=url, data_size=len(blob))
+
+    start = (START_TIME + timedelta(seconds=offset_s)).isoformat()
+    header = json.dumps({'measured_timestamp': start, 'channels': channels}).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(b'KDFJSON' + b'1.0' + struct.pack('<I', len(header)) + header)
+        for blob in blobs:
+            f.write(blob)
+    return int(rr.size)
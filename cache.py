@@ -0,0 +1,213 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+# Bump when a parser's output changes shape or content, so stale entries miss
+PARSER_VERSIONS = {
+    'fit_columns': 1,
+    'kdf_columns': 1,
+    'activity': 1,
+}
+
+CACHE_DIR_ENV = 'POLAR_GARMIN_CACHE_DIR'
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'polar_garmin_sync'
+DEFAULT_MAX_BYTES = 1 << 30
+DEFAULT_MEMORY_ENTRIES = 16
+
+_META = '__meta__'
+
+
+def _pack(value, arrays, prefix):
+    # Splits a result tree into .npz arrays and a JSON skeleton referring to them
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("object arrays are not cached on disk")
+        arrays[prefix] = value
+        return {'__array__': prefix}
+    if isinstance(value, dict):
+        return {'__dict__': [[k, _pack(v, arrays, f"{prefix}/{i}")] for i, (k, v) in enumerate(value.items())]}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, list):
+        return {'__list__': [_pack(v, arrays, f"{prefix}/{i}") for i, v in enumerate(value)]}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"{type(value).__name__} is not cached on disk")
+
+
+def _unpack(skeleton, arrays):
+    if isinstance(skeleton, dict):
+        if '__array__' in skeleton:
+            return arrays[skeleton['__array__']]
+        if '__dict__' in skeleton:
+            return {k: _unpack(v, arrays) for k, v in skeleton['__dict__']}
+        if '__datetime__' in skeleton:
+            return datetime.fromisoformat(skeleton['__datetime__'])
+        if '__list__' in skeleton:
+            return [_unpack(v, arrays) for v in skeleton['__list__']]
+    return skeleton
+
+
+class ParseCache:
+    """
+    Two-tier cache of parsed files, keyed by the file's content hash, the
+    parser's version and its arguments:
+      - memory: the last memory_entries results of this session (any object)
+      - disk:   .npz files under directory, evicted least-recently-used once
+                they take more than max_bytes; only results made of arrays,
+                dicts, lists, datetimes and JSON scalars are stored there
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.directory = Path(directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._hashes = {}       # (path, size, mtime_ns) -> content hash
+        self._lock = threading.Lock()
+
+    def file_hash(self, path):
+        """SHA-256 of the file's content, remembered while size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = (path, st.st_size, st.st_mtime_ns)
+        digest = self._hashes.get(stamp)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                while block := f.read(1 << 20):
+                    h.update(block)
+            digest = self._hashes[stamp] = h.hexdigest()
+        return digest
+
+    def key(self, kind, path, params=None):
+        version = PARSER_VERSIONS.get(kind, 0)
+        extra = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{kind}:{version}:{self.file_hash(path)}:{extra}".encode()).hexdigest()
+
+    def get_or_parse(self, kind, path, parse, params=None):
+        """
+        Returns the cached result of parse() for path, parsing (and caching)
+        it on a miss. params are folded into the key (e.g. selected fields).
+        """
+        key = self.key(kind, path, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        value = self._load(key)
+        if value is None:
+            value = parse()
+            self._store(key, value)
+        self._remember(key, value)
+        return value
+
+    def clear(self, disk=True):
+        with self._lock:
+            self._memory.clear()
+        if disk and self.directory.is_dir():
+            for entry in self.directory.glob('*.npz'):
+                entry.unlink(missing_ok=True)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return self.directory / f"{key}.npz"
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+        meta = arrays.pop(_META, None)
+        if meta is None:
+            return None
+        return _unpack(json.loads(meta.tobytes().decode('utf-8')), arrays)
+
+    def _store(self, key, value):
+        arrays = {}
+        try:
+            skeleton = _pack(value, arrays, 'a')
+        except TypeError:
+            return  # memory tier only
+        arrays[_META] = np.frombuffer(json.dumps(skeleton).encode('utf-8'), dtype=np.uint8)
+
+        path = self._path(key)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            buf = io.BytesIO()
+            np.savez(buf, **arrays)
+            with open(partial, 'wb') as f:
+                f.write(buf.getbuffer())
+            os.replace(partial, path)
+        except OSError as e:
+            print(f"Could not write parse cache entry: {e}")
+            partial.unlink(missing_ok=True)
+            return
+        self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the disk tier fits max_bytes
+        entries = []
+        for entry in self.directory.glob('*.npz'):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide ParseCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ParseCache()
+        return _cache
+
+
+def cached_fit_columns(filepath, fields=None):
+    """parser_fit.parse_fit_columns through the shared cache."""
+    from parser_fit import parse_fit_columns
+    params = None if fields is None else list(fields)
+    return get_cache().get_or_parse('fit_columns', filepath, lambda: parse_fit_columns(filepath, fields), params)
+
+
+def cached_kdf_columns(filepath, labels=None):
+    """parser_kdf.parse_kdf_columns through the shared cache (data loaded into memory)."""
+    from parser_kdf import parse_kdf_columns
+    params = None if labels is None else list(labels)
+    return get_cache().get_or_parse('kdf_columns', filepath, lambda: parse_kdf_columns(filepath, labels), params)
+
+
+def cached_activity(filepath):
+    """divider.ParsedActivity through the shared cache (memory tier only)."""
+    from divider import ParsedActivity
+    return get_cache().get_or_parse('activity', filepath, lambda: ParsedActivity(filepath))
@@ -0,0 +1,142 @@
+"""
+Headless processing core: parse -> sync -> write without Tk or a display.
+
+Importing this module is cheap. The pipeline functions below are resolved
+on first access, so a caller only pays for the modules (and the FIT
+libraries behind them) of the stages it actually runs:
+
+    import core
+    merged = core.sync_files(fit_path, kdf_path, output_fit)
+    core.split_file(fit_path, output_fit)
+
+gui.py and batch.py are frontends over this module.
+"""
+import importlib
+from progress import NULL_PROGRESS
+
+# Public name -> module that defines it, imported on first access
+_EXPORTS = {
+    'parse_fit_file': 'parser_fit',
+    'parse_fit_columns': 'parser_fit',
+    'iter_fit_timestamps': 'parser_fit',
+    'parse_kdf_file': 'parser_kdf',
+    'parse_kdf_columns': 'parser_kdf',
+    'iter_kdf_chunks': 'parser_kdf',
+    'sync_rr_to_fit_cpp': 'sync',
+    'sync_rr_to_fit_stream': 'sync',
+    'write_fit_with_hrv': 'writer_fit',
+    'write_fit_with_hrv_stream': 'writer_fit',
+    'write_fit_with_rr': 'writer_fit',
+    'write_split_fits_pure_python': 'writer_fit',
+    'ParsedActivity': 'divider',
+    'split_multisport_fit': 'divider',
+    'estimate_alignment': 'align',
+    'AlignmentRejected': 'align',
+    'hrv_metrics': 'hrv',
+    'record_columns': 'hrv',
+    'cached_fit_columns': 'cache',
+    'cached_kdf_columns': 'cache',
+    'cached_activity': 'cache',
+    'FIT_EPOCH': 'fit_native',
+}
+
+__all__ = sorted(_EXPORTS) + ['sync_files', 'split_file']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'core' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
+
+
+def sync_files(fit_path, kdf_path, output_fit=None, fit_fields=('timestamp',), max_tolerance=None,
+               progress=NULL_PROGRESS, align=False, hrv=False):
+    """
+    Syncs the RR intervals of a KDF recording onto a FIT activity (both
+    parsed through the content-hash cache) and returns the SyncedTable.
+    With output_fit, the RR intervals are also written there as hrv messages.
+    align=True first estimates the clock offset and drift between the two
+    devices from heart rate (align.estimate_alignment) and corrects the RR
+    times; the estimate is kept as the table's alignment. An estimate that
+    correlates too poorly is not applied: the RR times are synced as they
+    are and the estimate is kept as the table's alignment_rejected.
+    hrv=True computes rolling HRV metrics per record (hrv.record_columns),
+    kept as the table's hrv_columns and written as developer fields.
+    progress (a progress.ProgressReporter) sees the parse, (align,) sync, (hrv,) and write stages.
+    """
+    from cache import cached_fit_columns, cached_kdf_columns
+    from sync import sync_rr_to_fit_cpp
+
+    if align and 'heart_rate' not in fit_fields:
+        fit_fields = tuple(fit_fields) + ('heart_rate',)
+    progress.begin('parse', total=2)
+    fit_records = cached_fit_columns(fit_path, fit_fields)
+    progress.update(1)
+    rri = cached_kdf_columns(kdf_path, ['RRI']).get('RRI')
+    if rri is None:
+        raise ValueError(f"No RRI channel in {kdf_path}")
+    progress.end()
+
+    alignment = rejected = None
+    if align:
+        from align import AlignmentRejected, estimate_alignment
+        from parser_fit import fit_posix_times
+        from parser_kdf import channel_posix_times
+
+        progress.begin('align')
+        if 'heart_rate' not in fit_records:
+            raise ValueError(f"No heart_rate in {fit_path} to align against")
+        data = rri['data']
+        try:
+            alignment = estimate_alignment(fit_posix_times(fit_records), fit_records['heart_rate'],
+                                           channel_posix_times(rri), data[data.dtype.names[0]])
+            progress.end(message=repr(alignment))
+        except AlignmentRejected as e:
+            rejected = e.alignment
+            progress.end(message=f"rejected {rejected!r}")
+
+    progress.begin('sync', total=int(rri['data'].size))
+    merged = sync_rr_to_fit_cpp(fit_records, rri, max_tolerance, alignment=alignment)
+    merged.alignment_rejected = rejected
+    progress.end()
+
+    if hrv:
+        from hrv import record_columns
+
+        progress.begin('hrv')
+        merged.hrv_columns = record_columns(merged)
+        progress.end()
+    if output_fit:
+        from writer_fit import write_fit_with_hrv
+        write_fit_with_hrv(fit_path, merged, output_fit, progress, merged.hrv_columns)
+    return merged
+
+
+def split_file(fit_path, output_fit, workers=None, encoder='fast', progress=NULL_PROGRESS):
+    """
+    Splits a multisport FIT file into one file per sport segment and
+    transition, named after output_fit. Returns the number of files written.
+    progress sees the parse stage and then one 'split' unit per file written,
+    with the file's name as the message.
+    """
+    from cache import cached_activity
+    from writer_fit import write_split_fits_pure_python
+
+    progress.begin('parse')
+    activity = cached_activity(fit_path)
+    progress.end()
+
+    total = activity.output_count
+    progress.begin('split', total=total)
+    if total:
+        write_split_fits_pure_python(fit_path, output_fit, lambda path: progress.advance(message=path.name),
+                                     activity=activity, workers=workers, encoder=encoder)
+    progress.end()
+    return total
@@ -0,0 +1,182 @@
+import atexit
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+_here = Path(__file__).parent
+WORKER_SOURCE = _here / 'FitCsvWorker.java'
+
+
+class FitCsvToolWorker:
+    """
+    Long-lived FitCSVTool JVM (see FitCsvWorker.java) that takes conversion
+    jobs over stdin/stdout, so the JVM start-up and JIT warm-up are paid once
+    instead of once per conversion.
+
+    Jobs go through a bounded queue and are run one at a time by a feeder
+    thread. The JVM is health-checked with PING when (re)started and is
+    restarted after a crash, a protocol error or a job timeout.
+    """
+
+    def __init__(self, jar_path, java='java', max_queue=64, job_timeout=300.0, start_timeout=60.0):
+        self.jar_path = str(jar_path)
+        self.java = java
+        self.job_timeout = job_timeout
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._proc = None
+        self._lines = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._feed, name='FitCsvToolWorker', daemon=True)
+        self._thread.start()
+
+    # --- Public API ---
+    def submit(self, args, output=None):
+        """
+        Queues a FitCSVTool run with the given command-line args; blocks while
+        the queue is full. The returned Future resolves to output (when given,
+        it must exist and not be empty after the run) or raises RuntimeError
+        on failure.
+        """
+        if self._closed:
+            raise RuntimeError("FitCSVTool worker is closed.")
+        args = [str(a) for a in args]
+        if any('\t' in a or '\n' in a for a in args):
+            raise ValueError("FitCSVTool arguments may not contain tabs or newlines.")
+        future = Future()
+        self._jobs.put(('RUN', args, output, future))
+        return future
+
+    def convert(self, args, output=None):
+        """Runs one conversion and waits for it (see submit)."""
+        return self.submit(args, output).result()
+
+    def ping(self):
+        """Health check through the job queue: True when the JVM answers PING."""
+        future = Future()
+        self._jobs.put(('PING', None, None, future))
+        try:
+            return future.result()
+        except RuntimeError:
+            return False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._jobs.put(None)
+        self._thread.join(timeout=self.job_timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- JVM management ---
+    def _start(self):
+        if not WORKER_SOURCE.exists():
+            raise RuntimeError(f"FitCsvWorker.java not found at {WORKER_SOURCE}")
+        self._proc = subprocess.Popen(
+            [self.java, '-cp', self.jar_path, str(WORKER_SOURCE)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding='utf-8', bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, args=(self._proc, self._lines), daemon=True).start()
+        if self._request('PING', self.start_timeout) != 'PONG':
+            self._stop()
+            raise RuntimeError("FitCSVTool worker failed its start-up health check.")
+
+    def _stop(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.poll() is None:
+                proc.stdin.write('QUIT\n')
+                proc.stdin.flush()
+                proc.wait(timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+
+    def _ensure_running(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        if self._proc is not None:
+            self._proc = None
+            self.restarts += 1
+            print(f"FitCSVTool worker exited; restarting (restart #{self.restarts})")
+        self._start()
+
+    @staticmethod
+    def _read_lines(proc, lines):
+        for line in proc.stdout:
+            lines.put(line.rstrip('\n'))
+        lines.put(None)  # EOF: the JVM is gone
+
+    def _request(self, line, timeout):
+        try:
+            self._proc.stdin.write(line + '\n')
+            self._proc.stdin.flush()
+            reply = self._lines.get(timeout=timeout)
+        except (OSError, ValueError, queue.Empty):
+            reply = None
+        if reply is None:
+            # Dead, wedged or timed out: drop this JVM, the next job restarts it
+            if self._proc is not None:
+                self._proc.kill()
+                self._proc.wait()
+                self.restarts += 1
+                self._proc = None
+        return reply
+
+    def _feed(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            command, args, output, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._ensure_running()
+                if command == 'PING':
+                    future.set_result(self._request('PING', self.start_timeout) == 'PONG')
+                    continue
+                reply = self._request('\t'.join(['RUN'] + args), self.job_timeout)
+                if reply is None:
+                    raise RuntimeError(f"FitCSVTool worker died or timed out running {args}")
+                if reply != 'OK':
+                    raise RuntimeError(f"FitCSVTool failed: {reply[4:] if reply.startswith('ERR ') else reply}")
+                # CSVTool prints its usage and returns normally on bad arguments
+                if output is not None and not (os.path.exists(output) and os.path.getsize(output)):
+                    raise RuntimeError(f"FitCSVTool did not produce {output}")
+                future.set_result(output)
+            except Exception as e:
+                future.set_exception(e)
+        self._stop()
+
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(jar_path):
+    """Shared worker for jar_path, started on first use and closed at exit."""
+    key = str(Path(jar_path).resolve())
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None or worker._closed:
+            worker = _workers[key] = FitCsvToolWorker(jar_path)
+        return worker
+
+
+@atexit.register
+def _close_workers():
+    for worker in list(_workers.values()):
+        worker.close()
@@ -1,59 +1,260 @@
-from fitparse import FitFile
-from datetime import datetime
-from collections import defaultdict
+from collections import namedtuple
+from collections.abc import Sequence
+import numpy as np
+from fit_native import FIT_EPOCH, MESG_RECORD, iter_messages
 
-def split_multisport_fit(fit_path):
+# fitparse and fit_tool are imported where they are used: they dominate the
+# import time of this module and only split_multisport_fit and the legacy
+# fit_tool encoder need them.
+
+
+class SegmentView(Sequence):
+    """
+    Read-only window onto a slice of a shared message list, so segments can be
+    handed out without copying their messages.
+    """
+
+    def __init__(self, messages, start, stop):
+        self._messages = messages
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._messages[i] for i in range(self._start, self._stop)[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return self._messages[self._start + index]
+
+    def __iter__(self):
+        for i in range(self._start, self._stop):
+            yield self._messages[i]
+
+    def __repr__(self):
+        return f"SegmentView({len(self)} messages)"
+
+
+def split_multisport_fit(fit_path, view=False):
     """
     Splits a multisport .fit file into sport segments + transition events.
-    
+
     Returns a dict with:
       - 'sports': list of dicts { 'sport': <Sport>, 'start': <datetime>, 'end': <datetime or None>, 'messages': [FitMessage,...] }
       - 'transitions': [FitMessage,...]
+
+    The file is decoded once; each timestamped message is assigned to its
+    segment by binary search over the session start times. With view=True,
+    'messages' are SegmentViews over one shared list instead of copied lists.
     """
+    from fitparse import FitFile
+
     fitfile = FitFile(fit_path)
 
-    # 1) Read all session messages to get sport & start times
+    # 1) Single pass: sessions, transition events and every timestamped message
     sessions = []
-    for session in fitfile.get_messages('session'):
-        data = {f.name: f.value for f in session}
-        sessions.append({
-            'sport': data.get('sport'),
-            'start': data.get('start_time'),
-            # we'll infer end time from the next session
-        })
+    transitions = []
+    stamped = []
+    stamps = []
+    for msg in fitfile.get_messages():
+        if msg.name == 'session':
+            data = msg.get_values()
+            sessions.append({
+                'sport': data.get('sport'),
+                'start': data.get('start_time'),
+                # we'll infer end time from the next session
+            })
+        elif msg.name == 'event' and msg.get_value('event_type') == 'transition':
+            transitions.append(msg)
+
+        # most messages have a 'timestamp' field
+        ts = msg.get_value('timestamp')
+        if ts is not None:
+            stamped.append(msg)
+            stamps.append(ts)
+
+    if not sessions:
+        return {'sports': [], 'transitions': transitions}
+
     # sort by start time
     sessions.sort(key=lambda s: s['start'])
     for i in range(len(sessions) - 1):
         sessions[i]['end'] = sessions[i+1]['start']
     sessions[-1]['end'] = None
 
-    # 2) Bucket all messages by timestamp into each sport segment
+    # 2) Segment of each message = last session starting at or before it
+    starts = np.array([s['start'] for s in sessions], dtype='datetime64[us]')
+    times = np.array(stamps, dtype='datetime64[us]')
+    segment = np.searchsorted(starts, times, side='right') - 1
+
+    # Group messages by segment, keeping file order within each segment
+    order = np.argsort(segment, kind='stable')
+    grouped = [stamped[k] for k in order]
+    bounds = np.searchsorted(segment[order], np.arange(len(sessions) + 1))
+
     sports_segments = []
-    for sess in sessions:
-        bucket = []
-        for msg in fitfile.get_messages():
-            # most messages have a 'timestamp' field
-            ts_field = next((f for f in msg if f.name=='timestamp'), None)
-            if ts_field is None or ts_field.value is None:
-                continue
-            ts = ts_field.value
-            if ts >= sess['start'] and (sess['end'] is None or ts < sess['end']):
-                bucket.append(msg)
+    for i, sess in enumerate(sessions):
+        lo, hi = int(bounds[i]), int(bounds[i + 1])
         sports_segments.append({
             'sport': sess['sport'],
             'start': sess['start'],
             'end': sess['end'],
-            'messages': bucket
+            'messages': SegmentView(grouped, lo, hi) if view else grouped[lo:hi]
         })
 
-    # 3) Extract all transition events
-    transitions = []
-    for msg in fitfile.get_messages('event'):
-        ev = {f.name: f.value for f in msg}
-        if ev.get('event_type') == 'transition':
-            transitions.append(msg)
-
     return {
         'sports': sports_segments,
         'transitions': transitions
-    }
\ No newline at end of file
+    }
+
+
+# FIT profile `sport` enum, value -> name (as fitparse and fit_tool report them)
+SPORTS = {
+    0: 'generic', 1: 'running', 2: 'cycling', 3: 'transition', 4: 'fitness_equipment', 5: 'swimming',
+    6: 'basketball', 7: 'soccer', 8: 'tennis', 9: 'american_football', 10: 'training', 11: 'walking',
+    12: 'cross_country_skiing', 13: 'alpine_skiing', 14: 'snowboarding', 15: 'rowing', 16: 'mountaineering',
+    17: 'hiking', 18: 'multisport', 19: 'paddling', 20: 'flying', 21: 'e_biking', 22: 'motorcycling',
+    23: 'boating', 24: 'driving', 25: 'golf', 26: 'hang_gliding', 27: 'horseback_riding', 28: 'hunting',
+    29: 'fishing', 30: 'inline_skating', 31: 'rock_climbing', 32: 'sailing', 33: 'ice_skating',
+    34: 'sky_diving', 35: 'snowshoeing', 36: 'snowmobiling', 37: 'stand_up_paddleboarding', 38: 'surfing',
+    39: 'wakeboarding', 40: 'water_skiing', 41: 'kayaking', 42: 'rafting', 43: 'windsurfing',
+    44: 'kitesurfing', 45: 'tactical', 46: 'jumpmaster', 47: 'boxing', 48: 'floor_climbing', 49: 'baseball',
+    53: 'diving', 56: 'shooting', 58: 'winter_sport', 59: 'grinding', 62: 'hiit', 63: 'video_gaming',
+    64: 'racket', 65: 'wheelchair_push_walk', 66: 'wheelchair_push_run', 67: 'meditation', 68: 'para_sport',
+    69: 'disc_golf', 70: 'team_sport', 71: 'cricket', 72: 'rugby', 73: 'hockey', 74: 'lacrosse',
+    75: 'volleyball', 76: 'water_tubing', 77: 'wakesurfing', 78: 'water_sport', 79: 'archery',
+    80: 'mixed_martial_arts', 81: 'motor_sports', 82: 'snorkeling', 83: 'dance', 84: 'jump_rope',
+    85: 'pool_apnea', 86: 'mobility', 87: 'geocaching', 88: 'canoeing', 254: 'all',
+}
+# FIT profile `event_type` enum, value -> name
+EVENT_TYPES = {
+    0: 'start', 1: 'stop', 2: 'consecutive_depreciated', 3: 'marker', 4: 'stop_all',
+    5: 'begin_depreciated', 6: 'end_depreciated', 7: 'end_all_depreciated', 8: 'stop_disable',
+    9: 'stop_disable_all',
+}
+
+MESG_SESSION = 18
+MESG_EVENT = 21
+FIELD_SESSION_START_TIME = 2
+FIELD_SESSION_SPORT = 5
+FIELD_EVENT_TYPE = 1
+
+RawMessage = namedtuple('RawMessage', ['definition', 'payload', 'timestamp'])
+RawMessage.__doc__ = """
+One source message kept undecoded: its fit_native.FitDefinition, the
+payload bytes (without the header byte) and its resolved FIT timestamp.
+"""
+
+
+def _enum_name(names, value):
+    """Lower-case profile name of an enum value, as fitparse reports it."""
+    if value is None:
+        return None
+    return names.get(value, value)
+
+
+def _field(msg, payload, num):
+    # Raw value of a single-value field (None when absent or invalid)
+    slot = msg.definition.scalars.get(num)
+    if slot is None:
+        return None
+    index, invalid = slot
+    value = msg.definition.struct.unpack(payload)[index]
+    return None if value == invalid else value
+
+
+class ParsedActivity:
+    """
+    A multisport .fit file scanned once (with fit_native) and shared by
+    output counting, segmentation and writing.
+
+      - sessions:     [{ 'sport': <str>, 'start': <ms>, 'end': <ms or None> }, ...] sorted by start
+      - transitions:  [RawMessage, ...] transition events
+      - record_times: int64 ndarray of record timestamps (POSIX ms), sorted
+
+    The fit_tool messages the legacy encoder needs (records, and
+    transition_messages) are decoded with fit_tool on first access only.
+    """
+
+    def __init__(self, fit_path):
+        self.fit_path = fit_path
+        with open(fit_path, 'rb') as f:
+            buf = f.read()
+
+        sessions = []
+        self.transitions = []
+        stamps = []
+        for msg in iter_messages(buf):
+            if msg.is_definition:
+                continue
+            global_num = msg.definition.global_num
+            if global_num == MESG_RECORD:
+                if msg.timestamp is not None:
+                    stamps.append(msg.timestamp)
+            elif global_num == MESG_SESSION:
+                payload = buf[msg.start + 1:msg.end]
+                start = _field(msg, payload, FIELD_SESSION_START_TIME)
+                sessions.append({'sport': _enum_name(SPORTS, _field(msg, payload, FIELD_SESSION_SPORT)),
+                                 'start': None if start is None else (start + FIT_EPOCH) * 1000})
+            elif global_num == MESG_EVENT:
+                payload = buf[msg.start + 1:msg.end]
+                if _enum_name(EVENT_TYPES, _field(msg, payload, FIELD_EVENT_TYPE)) == 'transition':
+                    self.transitions.append(RawMessage(msg.definition, payload, msg.timestamp))
+
+        # sort by start time; each session ends where the next one starts
+        sessions.sort(key=lambda s: s['start'])
+        for i, sess in enumerate(sessions):
+            sess['end'] = sessions[i + 1]['start'] if i + 1 < len(sessions) else None
+        self.sessions = sessions
+
+        self.record_times = np.sort((np.array(stamps, dtype=np.int64) + FIT_EPOCH) * 1000, kind='stable')
+        self._fit_tool = None
+
+    def _decode_fit_tool(self):
+        # fit_tool RecordMessages (sorted by timestamp) and transition EventMessages, for the legacy encoder
+        if self._fit_tool is None:
+            from fit_tool.fit_file import FitFile as FitToolFile
+            from fit_tool.profile.messages.record_message import RecordMessage
+            from fit_tool.profile.messages.event_message import EventMessage
+
+            records, transitions = [], []
+            for rw in FitToolFile.from_file(self.fit_path).records:
+                msg = rw.message
+                if isinstance(msg, RecordMessage):
+                    if msg.timestamp is not None:
+                        records.append(msg)
+                elif isinstance(msg, EventMessage) and _enum_name(EVENT_TYPES, msg.event_type) == 'transition':
+                    transitions.append(msg)
+            records.sort(key=lambda r: r.timestamp)
+            times = np.array([r.timestamp for r in records], dtype=np.int64)
+            self._fit_tool = records, transitions, times
+        return self._fit_tool
+
+    @property
+    def records(self):
+        """fit_tool RecordMessages sorted by timestamp (decoded on first use)."""
+        return self._decode_fit_tool()[0]
+
+    @property
+    def transition_messages(self):
+        """fit_tool EventMessages of the transitions (decoded on first use)."""
+        return self._decode_fit_tool()[1]
+
+    @property
+    def output_count(self):
+        """Number of files a split writes: one per sport segment and per transition."""
+        return len(self.sessions) + len(self.transitions)
+
+    def segment_records(self, start, end=None):
+        """
+        fit_tool records with start <= timestamp < end (ms; end=None is
+        open-ended), found by bisecting the sorted record timestamps.
+        """
+        records, _, times = self._decode_fit_tool()
+        lo = int(np.searchsorted(times, start, side='left'))
+        hi = len(records) if end is None else int(np.searchsorted(times, end, side='left'))
+        return records[lo:hi]
@@ -0,0 +1,200 @@
+import struct
+import time
+import numpy as np
+from fit_native import (BASE_TYPES, FIELD_TIMESTAMP, FIT_EPOCH, MESG_RECORD, crc16,
+                        iter_messages)
+
+# File header as written by fit_tool: 12 bytes, protocol 2.3, profile 21.212
+FIT_PROTOCOL_VERSION = 0x23
+FIT_PROFILE_VERSION = 21212
+
+# file_id (local type 0): type, manufacturer, product, serial_number, time_created
+_FILE_ID_DEFINITION = bytes([0x40, 0, 0]) + struct.pack('<HB', 0, 5) + bytes([
+    0, 1, 0x00, 1, 2, 0x84, 2, 2, 0x84, 3, 4, 0x8C, 4, 4, 0x86])
+FILE_TYPE_ACTIVITY = 4
+MANUFACTURER_DEVELOPMENT = 255
+SERIAL_NUMBER = 0x12345678
+
+# struct code -> NumPy type code
+_NUMPY_CODES = {'B': 'u1', 'b': 'i1', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4',
+                'f': 'f4', 'd': 'f8', 'q': 'i8', 'Q': 'u8'}
+
+
+def _field_dtype(size, base, endian):
+    code, _ = BASE_TYPES.get(base & 0x1F, (None, None))
+    if code is None:
+        return f'V{size}'
+    elem = struct.calcsize(code)
+    if size % elem:
+        return f'V{size}'
+    count = size // elem
+    return (endian + _NUMPY_CODES[code], (count,)) if count > 1 else endian + _NUMPY_CODES[code]
+
+
+def _layout_dtypes(definition):
+    """
+    (source payload dtype, output row dtype, output field list) for a record
+    definition. Output rows are little-endian, start with the message header
+    byte, always carry a timestamp and drop developer fields.
+    """
+    endian = '>' if definition.big_endian else '<'
+    src, out, fields = [], [('header', 'u1')], []
+    if not any(num == FIELD_TIMESTAMP and size == 4 for num, size, _ in definition.fields):
+        out.append(('ts', '<u4'))
+        fields.append((FIELD_TIMESTAMP, 4, 0x86))
+    for k, (num, size, base) in enumerate(definition.fields):
+        name = 'ts' if num == FIELD_TIMESTAMP and size == 4 else f'f{k}'
+        src.append((name, _field_dtype(size, base, endian)))
+        out.append((name, _field_dtype(size, base, '<')))
+        fields.append((num, size, base))
+    for k, (_, size, _) in enumerate(definition.dev_fields):
+        src.append((f'd{k}', f'V{size}'))
+    return np.dtype(src), np.dtype(out), fields
+
+
+def _definition_bytes(local_type, fields):
+    return (bytes([0x40 | local_type, 0, 0]) + struct.pack('<HB', MESG_RECORD, len(fields))
+            + b''.join(bytes(field) for field in fields))
+
+
+class FitRecordEncoder:
+    """
+    Fast path for writing slices of a FIT file's `record` messages to new
+    files. The source is scanned once; the records of each distinct field
+    layout are gathered in bulk into one NumPy row array, and that layout's
+    definition message is built once and reused by every output:
+
+        encoder = FitRecordEncoder(fit_path)
+        encoder.write(out_path, start_ms, end_ms)
+
+    Records keep their raw field values (converted to little-endian), with
+    compressed timestamps made explicit; developer fields are dropped.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            buf = bytes(source)
+        else:
+            with open(source, 'rb') as f:
+                buf = f.read()
+
+        layout_ids = {}
+        starts, stamps, per_layout = [], [], []
+        for msg in iter_messages(buf):
+            definition = msg.definition
+            if msg.is_definition or definition.global_num != MESG_RECORD or msg.timestamp is None:
+                continue
+            key = (definition.big_endian, tuple(definition.fields), tuple(definition.dev_fields))
+            k = layout_ids.get(key)
+            if k is None:
+                k = layout_ids[key] = len(per_layout)
+                per_layout.append((definition, []))
+            per_layout[k][1].append(len(starts))
+            starts.append(msg.start)
+            stamps.append(msg.timestamp)
+
+        data = np.frombuffer(buf, dtype=np.uint8)
+        starts = np.array(starts, dtype=np.int64)
+        stamps = np.array(stamps, dtype=np.int64)
+        layout = np.zeros(starts.size, dtype=np.intp)
+        row = np.zeros(starts.size, dtype=np.intp)
+
+        self._definitions = []
+        self._rows = []
+        self._local_types = []
+        for k, (definition, members) in enumerate(per_layout):
+            members = np.array(members, dtype=np.intp)
+            layout[members] = k
+            row[members] = np.arange(members.size)
+
+            src_dtype, out_dtype, fields = _layout_dtypes(definition)
+            local_type = 1 + k % 15
+            # Gather every payload of this layout at once: (n, size) bytes -> structured rows
+            payload = data[starts[members, None] + 1 + np.arange(src_dtype.itemsize)]
+            src = np.ascontiguousarray(payload).view(src_dtype)[:, 0]
+            rows = np.zeros(members.size, dtype=out_dtype)
+            rows['header'] = local_type
+            for name in src_dtype.names:
+                if name in out_dtype.names:
+                    rows[name] = src[name]
+            rows['ts'] = stamps[members]
+
+            self._definitions.append(_definition_bytes(local_type, fields))
+            self._rows.append(rows)
+            self._local_types.append(local_type)
+
+        order = np.argsort(stamps, kind='stable')
+        self.record_times = (stamps[order] + FIT_EPOCH) * 1000   # POSIX ms, as ParsedActivity
+        self._layout = layout[order]
+        self._row = row[order]
+
+    def encode(self, start, end=None, time_created=None):
+        """
+        Messages (list of bytes) for a file holding the records with
+        start <= timestamp < end (POSIX ms; end=None is open-ended).
+        """
+        lo = int(np.searchsorted(self.record_times, start, side='left'))
+        hi = self._layout.size if end is None else int(np.searchsorted(self.record_times, end, side='left'))
+        parts = _file_id(time_created)
+
+        layouts = self._layout[lo:hi]
+        rows = self._row[lo:hi]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(layouts)) + 1, [layouts.size]))
+        defined = {}   # local type -> layout currently defined on it
+        for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            if a == b:
+                continue
+            k = int(layouts[a])
+            local_type = self._local_types[k]
+            if defined.get(local_type) != k:
+                parts.append(self._definitions[k])
+                defined[local_type] = k
+            parts.append(self._rows[k][rows[a:b]].tobytes())
+        return parts
+
+    def write(self, path, start, end=None, time_created=None):
+        """Writes the records in [start, end) to a new FIT file at path."""
+        write_fit_file(path, self.encode(start, end, time_created))
+
+
+def _file_id(time_created=None):
+    # file_id definition and message opening every output
+    if time_created is None:
+        time_created = int(time.time())
+    return [_FILE_ID_DEFINITION, struct.pack(
+        '<BBHHII', 0, FILE_TYPE_ACTIVITY, MANUFACTURER_DEVELOPMENT, 0, SERIAL_NUMBER,
+        time_created - FIT_EPOCH)]
+
+
+def encode_message(message, time_created=None):
+    """
+    Messages (list of bytes) for a file holding one source message, e.g. a
+    divider.RawMessage: its definition is rebuilt on local type 1, a
+    compressed timestamp is made explicit and developer fields are dropped.
+    """
+    definition = message.definition
+    endian = '>' if definition.big_endian else '<'
+    dev_size = sum(size for _, size, _ in definition.dev_fields)
+    payload = bytes(message.payload[:len(message.payload) - dev_size])
+    fields = list(definition.fields)
+    if definition.timestamp is None and message.timestamp is not None:
+        fields.insert(0, (FIELD_TIMESTAMP, 4, 0x86))
+        payload = struct.pack(endian + 'I', message.timestamp) + payload
+    header = (bytes([0x40 | 1, 0, 1 if definition.big_endian else 0])
+              + struct.pack(endian + 'HB', definition.global_num, len(fields)))
+    return _file_id(time_created) + [header + b''.join(bytes(f) for f in fields), bytes([1]) + payload]
+
+
+def write_fit_file(path, messages):
+    """
+    Writes a FIT file from encoded messages through a buffered handle,
+    computing the file CRC incrementally as the bytes go out.
+    """
+    data_size = sum(len(m) for m in messages)
+    header = struct.pack('<BBHI4s', 12, FIT_PROTOCOL_VERSION, FIT_PROFILE_VERSION, data_size, b'.FIT')
+    crc = 0
+    with open(path, 'wb', buffering=1 << 16) as f:
+        for part in (header, *messages):
+            f.write(part)
+            crc = crc16(part, crc)
+        f.write(struct.pack('<H', crc))
@@ -0,0 +1,292 @@
+// fit_native.cpp
+// Native decoder for the FIT record-message hot path.
+// Written as C++ code but using C headers for broad compatibility.
+
+#include <stddef.h>  // size_t
+#include <stdint.h>  // fixed-width integers
+#include <string.h>  // memcpy()
+#include <math.h>    // NAN
+
+#ifdef _WIN32
+  #define EXPORT __declspec(dllexport)
+#else
+  #define EXPORT
+#endif
+
+#define FIT_RECORD_MESG       20
+#define FIT_TIMESTAMP_FIELD   253
+#define FIT_MAX_FIELDS        256
+
+#define FIT_ERR_HEADER        -1
+#define FIT_ERR_TRUNCATED     -2
+#define FIT_ERR_CRC           -3
+#define FIT_ERR_UNDEFINED     -4
+
+static const uint16_t crc_table[16] = {
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400
+};
+
+static uint16_t crc_update(uint16_t crc, const unsigned char* p, size_t n)
+{
+    for (size_t i = 0; i < n; ++i) {
+        uint16_t tmp = crc_table[crc & 0xF];
+        crc = (crc >> 4) & 0x0FFF;
+        crc = crc ^ tmp ^ crc_table[p[i] & 0xF];
+        tmp = crc_table[crc & 0xF];
+        crc = (crc >> 4) & 0x0FFF;
+        crc = crc ^ tmp ^ crc_table[(p[i] >> 4) & 0xF];
+    }
+    return crc;
+}
+
+struct Definition {
+    int      defined;
+    int      big_endian;
+    uint16_t global_num;
+    size_t   size;                         // total data-message payload size
+    size_t   n_fields;
+    uint8_t  num[FIT_MAX_FIELDS];
+    uint8_t  fsize[FIT_MAX_FIELDS];
+    uint8_t  base[FIT_MAX_FIELDS];
+    size_t   offset[FIT_MAX_FIELDS];
+};
+
+static uint64_t read_uint(const unsigned char* p, size_t n, int big_endian)
+{
+    uint64_t v = 0;
+    for (size_t i = 0; i < n; ++i) {
+        size_t k = big_endian ? i : n - 1 - i;
+        v = (v << 8) | p[k];
+    }
+    return v;
+}
+
+/**
+ * Decodes one scalar field into a double, NaN for FIT invalid values and
+ * for arrays/strings.
+ */
+static double decode_value(const unsigned char* p, uint8_t size, uint8_t base, int big_endian)
+{
+    switch (base & 0x1F) {
+    case 0x00:  // enum
+    case 0x02:  // uint8
+    case 0x0D:  // byte
+        if (size != 1 || p[0] == 0xFF) return NAN;
+        return p[0];
+    case 0x0A:  // uint8z
+        if (size != 1 || p[0] == 0x00) return NAN;
+        return p[0];
+    case 0x01:  // sint8
+        if (size != 1 || p[0] == 0x7F) return NAN;
+        return (int8_t)p[0];
+    case 0x03: { // sint16
+        if (size != 2) return NAN;
+        uint16_t v = (uint16_t)read_uint(p, 2, big_endian);
+        return v == 0x7FFF ? NAN : (double)(int16_t)v;
+    }
+    case 0x04: { // uint16
+        if (size != 2) return NAN;
+        uint16_t v = (uint16_t)read_uint(p, 2, big_endian);
+        return v == 0xFFFF ? NAN : (double)v;
+    }
+    case 0x0B: { // uint16z
+        if (size != 2) return NAN;
+        uint16_t v = (uint16_t)read_uint(p, 2, big_endian);
+        return v == 0 ? NAN : (double)v;
+    }
+    case 0x05: { // sint32
+        if (size != 4) return NAN;
+        uint32_t v = (uint32_t)read_uint(p, 4, big_endian);
+        return v == 0x7FFFFFFFu ? NAN : (double)(int32_t)v;
+    }
+    case 0x06: { // uint32
+        if (size != 4) return NAN;
+        uint32_t v = (uint32_t)read_uint(p, 4, big_endian);
+        return v == 0xFFFFFFFFu ? NAN : (double)v;
+    }
+    case 0x0C: { // uint32z
+        if (size != 4) return NAN;
+        uint32_t v = (uint32_t)read_uint(p, 4, big_endian);
+        return v == 0 ? NAN : (double)v;
+    }
+    case 0x08: { // float32
+        if (size != 4) return NAN;
+        uint32_t v = (uint32_t)read_uint(p, 4, big_endian);
+        if (v == 0xFFFFFFFFu) return NAN;
+        float f;
+        memcpy(&f, &v, 4);
+        return f;
+    }
+    case 0x09: { // float64
+        if (size != 8) return NAN;
+        uint64_t v = read_uint(p, 8, big_endian);
+        if (v == 0xFFFFFFFFFFFFFFFFull) return NAN;
+        double d;
+        memcpy(&d, &v, 8);
+        return d;
+    }
+    case 0x0E: { // sint64
+        if (size != 8) return NAN;
+        uint64_t v = read_uint(p, 8, big_endian);
+        return v == 0x7FFFFFFFFFFFFFFFull ? NAN : (double)(int64_t)v;
+    }
+    case 0x0F: { // uint64
+        if (size != 8) return NAN;
+        uint64_t v = read_uint(p, 8, big_endian);
+        return v == 0xFFFFFFFFFFFFFFFFull ? NAN : (double)v;
+    }
+    case 0x10: { // uint64z
+        if (size != 8) return NAN;
+        uint64_t v = read_uint(p, 8, big_endian);
+        return v == 0 ? NAN : (double)v;
+    }
+    default:    // string and unknown types
+        return NAN;
+    }
+}
+
+extern "C" {
+
+/**
+ * Decodes every `record` message of a (possibly chained) FIT file.
+ * field_nums lists the record field numbers to extract; values go to
+ * out[f * capacity + i] for record i, NaN where the field is missing or
+ * invalid. Timestamps from compressed-timestamp headers are resolved.
+ * Returns the number of records in the file (only the first `capacity` are
+ * written) or a negative FIT_ERR_* code.
+ */
+EXPORT long long fit_decode_records(const unsigned char* buf,
+                                    size_t len,
+                                    const unsigned char* field_nums,
+                                    size_t n_fields,
+                                    double* out,
+                                    size_t capacity,
+                                    int check_crc)
+{
+    Definition defs[16];
+    if (!buf) return FIT_ERR_HEADER;
+
+    size_t count = 0;
+    size_t pos = 0;
+
+    while (pos < len) {
+        // --- File header ---
+        if (len - pos < 12) return FIT_ERR_HEADER;
+        size_t header_size = buf[pos];
+        if (header_size < 12 || len - pos < header_size) return FIT_ERR_HEADER;
+        if (memcmp(buf + pos + 8, ".FIT", 4) != 0) return FIT_ERR_HEADER;
+        size_t data_size = (size_t)read_uint(buf + pos + 4, 4, 0);
+        size_t data_end = pos + header_size + data_size;
+        if (data_end + 2 > len) return FIT_ERR_TRUNCATED;
+        if (check_crc) {
+            uint16_t crc = crc_update(0, buf + pos, data_end - pos);
+            if (crc != (uint16_t)read_uint(buf + data_end, 2, 0)) return FIT_ERR_CRC;
+        }
+        pos += header_size;
+
+        memset(defs, 0, sizeof(defs));
+        uint32_t last_timestamp = 0;
+
+        // --- Records ---
+        while (pos < data_end) {
+            uint8_t header = buf[pos++];
+
+            if (!(header & 0x80) && (header & 0x40)) {
+                // Definition message
+                Definition* d = &defs[header & 0x0F];
+                if (data_end - pos < 5) return FIT_ERR_TRUNCATED;
+                d->big_endian = buf[pos + 1] == 1;
+                d->global_num = (uint16_t)read_uint(buf + pos + 2, 2, d->big_endian);
+                d->n_fields = buf[pos + 4];
+                pos += 5;
+                if (data_end - pos < d->n_fields * 3) return FIT_ERR_TRUNCATED;
+                size_t offset = 0;
+                for (size_t k = 0; k < d->n_fields; ++k) {
+                    d->num[k] = buf[pos];
+                    d->fsize[k] = buf[pos + 1];
+                    d->base[k] = buf[pos + 2];
+                    d->offset[k] = offset;
+                    offset += buf[pos + 1];
+                    pos += 3;
+                }
+                if (header & 0x20) {
+                    // Developer fields: only their sizes matter here
+                    if (pos >= data_end) return FIT_ERR_TRUNCATED;
+                    size_t n_dev = buf[pos++];
+                    if (data_end - pos < n_dev * 3) return FIT_ERR_TRUNCATED;
+                    for (size_t k = 0; k < n_dev; ++k) {
+                        offset += buf[pos + 1];
+                        pos += 3;
+                    }
+                }
+                d->size = offset;
+                d->defined = 1;
+                continue;
+            }
+
+            // Data message (normal or compressed-timestamp header)
+            int compressed = header & 0x80;
+            Definition* d = &defs[compressed ? (header >> 5) & 0x03 : header & 0x0F];
+            if (!d->defined) return FIT_ERR_UNDEFINED;
+            if (data_end - pos < d->size) return FIT_ERR_TRUNCATED;
+            const unsigned char* body = buf + pos;
+            pos += d->size;
+
+            uint32_t timestamp = 0;
+            int has_timestamp = 0;
+            if (compressed) {
+                uint32_t offset = header & 0x1F;
+                timestamp = (last_timestamp & 0xFFFFFFE0u) + offset;
+                if (offset < (last_timestamp & 0x1F)) timestamp += 0x20;
+                last_timestamp = timestamp;
+                has_timestamp = 1;
+            }
+            for (size_t k = 0; k < d->n_fields; ++k) {
+                if (d->num[k] == FIT_TIMESTAMP_FIELD && d->fsize[k] == 4) {
+                    uint32_t v = (uint32_t)read_uint(body + d->offset[k], 4, d->big_endian);
+                    if (v != 0xFFFFFFFFu) {
+                        timestamp = v;
+                        last_timestamp = v;
+                        has_timestamp = 1;
+                    }
+                }
+            }
+
+            if (d->global_num != FIT_RECORD_MESG) continue;
+
+            if (out && count < capacity) {
+                for (size_t f = 0; f < n_fields; ++f) {
+                    double value = NAN;
+                    if (field_nums[f] == FIT_TIMESTAMP_FIELD) {
+                        if (has_timestamp) value = (double)timestamp;
+                    } else {
+                        for (size_t k = 0; k < d->n_fields; ++k) {
+                            if (d->num[k] == field_nums[f]) {
+                                value = decode_value(body + d->offset[k], d->fsize[k],
+                                                     d->base[k], d->big_endian);
+                                break;
+                            }
+                        }
+                    }
+                    out[f * capacity + count] = value;
+                }
+            }
+            ++count;
+        }
+
+        pos = data_end + 2;  // skip file CRC
+    }
+
+    return (long long)count;
+}
+
+/**
+ * FIT CRC-16 over buf[0:len], continuing from `crc`.
+ */
+EXPORT uint16_t fit_crc16(const unsigned char* buf, size_t len, uint16_t crc)
+{
+    return crc_update(crc, buf, len);
+}
+
+} // extern "C"
@@ -0,0 +1,411 @@
+import ctypes
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+from native import load_library
+
+# Seconds between the POSIX epoch and the FIT epoch (1989-12-31T00:00:00Z)
+FIT_EPOCH = 631065600
+# FIT invalid value for uint32 timestamps
+FIT_TIMESTAMP_INVALID = 0xFFFFFFFF
+
+MESG_RECORD = 20
+FIELD_TIMESTAMP = 253
+
+# record field name -> (field number, scale, offset), as in the FIT profile
+RECORD_FIELDS = {
+    'timestamp':            (253, 1, 0),
+    'position_lat':         (0, 1, 0),
+    'position_long':        (1, 1, 0),
+    'altitude':             (2, 5, 500),
+    'heart_rate':           (3, 1, 0),
+    'cadence':              (4, 1, 0),
+    'distance':             (5, 100, 0),
+    'speed':                (6, 1000, 0),
+    'power':                (7, 1, 0),
+    'temperature':          (13, 1, 0),
+    'vertical_oscillation': (39, 10, 0),
+    'stance_time':          (41, 10, 0),
+    'fractional_cadence':   (53, 128, 0),
+    'enhanced_speed':       (73, 1000, 0),
+    'enhanced_altitude':    (78, 5, 500),
+}
+
+# base type id (low 5 bits) -> (struct code, invalid value); floats are NaN when invalid
+BASE_TYPES = {
+    0x00: ('B', 0xFF),                  # enum
+    0x01: ('b', 0x7F),                  # sint8
+    0x02: ('B', 0xFF),                  # uint8
+    0x03: ('h', 0x7FFF),                # sint16
+    0x04: ('H', 0xFFFF),                # uint16
+    0x05: ('i', 0x7FFFFFFF),            # sint32
+    0x06: ('I', 0xFFFFFFFF),            # uint32
+    0x08: ('f', None),                  # float32
+    0x09: ('d', None),                  # float64
+    0x0A: ('B', 0x00),                  # uint8z
+    0x0B: ('H', 0x0000),                # uint16z
+    0x0C: ('I', 0x00000000),            # uint32z
+    0x0D: ('B', 0xFF),                  # byte
+    0x0E: ('q', 0x7FFFFFFFFFFFFFFF),    # sint64
+    0x0F: ('Q', 0xFFFFFFFFFFFFFFFF),    # uint64
+    0x10: ('Q', 0x0000000000000000),    # uint64z
+}
+
+_ERRORS = {
+    -1: "Not a FIT file (bad file header).",
+    -2: "Truncated FIT file.",
+    -3: "FIT file CRC mismatch.",
+    -4: "FIT data message uses an undefined local message type.",
+}
+
+_CRC_NIBBLES = (0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400)
+
+
+def _crc_byte_table():
+    # Folds the SDK's two nibble steps into one lookup per byte
+    table = []
+    for byte in range(256):
+        crc = 0
+        for nibble in (byte & 0xF, byte >> 4):
+            tmp = _CRC_NIBBLES[crc & 0xF]
+            crc = (crc >> 4) & 0x0FFF
+            crc = crc ^ tmp ^ _CRC_NIBBLES[nibble]
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_byte_table()
+
+# --- Native library (optional) ---
+_lib = load_library("fit_native")
+if _lib is not None:
+    _lib.fit_decode_records.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS"),   # buf
+        ctypes.c_size_t,                                                # len
+        np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS"),   # field_nums
+        ctypes.c_size_t,                                                # n_fields
+        np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),  # out
+        ctypes.c_size_t,                                                # capacity
+        ctypes.c_int,                                                   # check_crc
+    ]
+    _lib.fit_decode_records.restype = ctypes.c_longlong
+    _lib.fit_crc16.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint16]
+    _lib.fit_crc16.restype = ctypes.c_uint16
+
+
+def crc16(data, crc=0):
+    """FIT CRC-16 of data, continuing from crc."""
+    if _lib is not None:
+        return _lib.fit_crc16(bytes(data), len(data), crc)
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+# --- Pure-Python scanner ---
+FitDefinition = namedtuple('FitDefinition', [
+    'global_num', 'big_endian', 'fields', 'dev_fields', 'size', 'struct', 'scalars', 'timestamp'])
+FitDefinition.__doc__ = """
+Parsed definition message. fields/dev_fields are (number, size, base type)
+tuples; struct unpacks a whole data payload; scalars maps a field number to
+(tuple index, invalid value) for single-value fields; timestamp is the byte
+offset of field 253 or None.
+"""
+
+FitMessage = namedtuple('FitMessage', ['start', 'end', 'local_type', 'is_definition', 'definition', 'timestamp'])
+FitMessage.__doc__ = """
+One message of a FIT file: buf[start:end] are its bytes (header included),
+definition is the definition in effect (or the new one), timestamp the
+resolved timestamp of a data message, or None.
+"""
+
+
+def read_definition(buf, pos, header, end=None):
+    """
+    Parses the definition message whose content starts at buf[pos] (just
+    after its header byte) and ends by buf[end] (default: the end of buf).
+    Returns (FitDefinition, position after it).
+    """
+    # Bounds checked as in fit_native.cpp, so both decoders fail alike
+    end = len(buf) if end is None else end
+    if end - pos < 5:
+        raise ValueError(_ERRORS[-2])
+    big_endian = buf[pos + 1] == 1
+    endian = '>' if big_endian else '<'
+    global_num = struct.unpack_from(endian + 'H', buf, pos + 2)[0]
+    n_fields = buf[pos + 4]
+    pos += 5
+    if end - pos < 3 * n_fields:
+        raise ValueError(_ERRORS[-2])
+    fields = [tuple(buf[pos + 3 * k:pos + 3 * k + 3]) for k in range(n_fields)]
+    pos += 3 * n_fields
+    dev_fields = []
+    if header & 0x20:
+        if pos >= end:
+            raise ValueError(_ERRORS[-2])
+        n_dev = buf[pos]
+        pos += 1
+        if end - pos < 3 * n_dev:
+            raise ValueError(_ERRORS[-2])
+        dev_fields = [tuple(buf[pos + 3 * k:pos + 3 * k + 3]) for k in range(n_dev)]
+        pos += 3 * n_dev
+
+    codes, scalars, offset, timestamp = [], {}, 0, None
+    for num, size, base in fields:
+        code, invalid = BASE_TYPES.get(base & 0x1F, (None, None))
+        if code is not None and struct.calcsize(code) == size:
+            scalars.setdefault(num, (len(codes), invalid))
+            if num == FIELD_TIMESTAMP and size == 4:
+                timestamp = offset
+            codes.append(code)
+        else:
+            codes.append(f'{size}s')
+        offset += size
+    for _, size, _ in dev_fields:
+        codes.append(f'{size}s')
+        offset += size
+
+    definition = FitDefinition(global_num, big_endian, fields, dev_fields, offset,
+                               struct.Struct(endian + ''.join(codes)), scalars, timestamp)
+    return definition, pos
+
+
+def read_file_header(buf, pos=0, complete=True):
+    """
+    Validates the file header at buf[pos]. Returns (header size, data size).
+    With complete=False only the header itself has to be in buf (streams).
+    """
+    if len(buf) - pos < 12 or buf[pos] < 12 or bytes(buf[pos + 8:pos + 12]) != b'.FIT':
+        raise ValueError(_ERRORS[-1])
+    header_size = buf[pos]
+    data_size = struct.unpack_from('<I', buf, pos + 4)[0]
+    if pos + header_size + (data_size + 2 if complete else 0) > len(buf):
+        raise ValueError(_ERRORS[-2])
+    return header_size, data_size
+
+
+def _data_timestamp(buf, start, header, definition, last_timestamp):
+    # Resolves a data message's timestamp: (timestamp or None, new last_timestamp)
+    timestamp = None
+    if header & 0x80:
+        offset = header & 0x1F
+        timestamp = (last_timestamp & 0xFFFFFFE0) + offset
+        if offset < (last_timestamp & 0x1F):
+            timestamp += 0x20
+        last_timestamp = timestamp
+    if definition.timestamp is not None:
+        fmt = '>I' if definition.big_endian else '<I'
+        value = struct.unpack_from(fmt, buf, start + 1 + definition.timestamp)[0]
+        if value != FIT_TIMESTAMP_INVALID:
+            timestamp = last_timestamp = value
+    return timestamp, last_timestamp
+
+
+def iter_messages(buf, check_crc=True):
+    """
+    Walks a (possibly chained) FIT file and yields a FitMessage for every
+    definition and data message, resolving compressed-timestamp headers.
+    """
+    pos = 0
+    while pos < len(buf):
+        header_size, data_size = read_file_header(buf, pos)
+        data_end = pos + header_size + data_size
+        if check_crc and crc16(buf[pos:data_end]) != struct.unpack_from('<H', buf, data_end)[0]:
+            raise ValueError(_ERRORS[-3])
+        pos += header_size
+
+        definitions = [None] * 16
+        last_timestamp = 0
+        while pos < data_end:
+            start = pos
+            header = buf[pos]
+            pos += 1
+
+            if not header & 0x80 and header & 0x40:
+                local_type = header & 0x0F
+                definition, pos = read_definition(buf, pos, header, data_end)
+                definitions[local_type] = definition
+                yield FitMessage(start, pos, local_type, True, definition, None)
+                continue
+
+            compressed = header & 0x80
+            local_type = (header >> 5) & 0x03 if compressed else header & 0x0F
+            definition = definitions[local_type]
+            if definition is None:
+                raise ValueError(_ERRORS[-4])
+            pos += definition.size
+            if pos > data_end:
+                raise ValueError(_ERRORS[-2])
+
+            timestamp, last_timestamp = _data_timestamp(buf, start, header, definition, last_timestamp)
+            yield FitMessage(start, pos, local_type, False, definition, timestamp)
+
+        pos = data_end + 2  # skip file CRC
+
+
+def iter_message_stream(source, check_crc=True, chained=True, block_size=1 << 16):
+    """
+    Incremental iter_messages over a path or a binary file object (e.g. a
+    pipe fed by an upload still in progress). Bytes are read in blocks and
+    dropped once scanned, so memory stays bounded by the block size.
+    Yields (FitMessage, message bytes); start/end are offsets in the stream.
+    The file CRC can only be checked after a file's data has been read, so a
+    mismatch raises at the end of that file. chained=False stops after the
+    first file.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter_message_stream(f, check_crc, chained, block_size)
+        return
+
+    buf = bytearray()
+    base = 0        # stream offset of buf[0]
+    eof = False
+
+    def fill(n):
+        # Reads until buf holds n bytes; False if the stream ends first
+        nonlocal eof
+        while len(buf) < n and not eof:
+            block = source.read(max(block_size, n - len(buf)))
+            if block:
+                buf.extend(block)
+            else:
+                eof = True
+        return len(buf) >= n
+
+    pos = 0
+    while fill(pos + 1):
+        fill(pos + 14)
+        header_size, data_size = read_file_header(buf, pos, complete=False)
+        data_end = base + pos + header_size + data_size
+        crc, crc_from = 0, pos
+        pos += header_size
+
+        definitions = [None] * 16
+        last_timestamp = 0
+        while base + pos < data_end:
+            if pos >= block_size:
+                # Drop scanned bytes, folding them into the running CRC first
+                if check_crc:
+                    crc = crc16(buf[crc_from:pos], crc)
+                del buf[:pos]
+                base += pos
+                pos = crc_from = 0
+
+            start = pos
+            if not fill(pos + 1):
+                raise ValueError(_ERRORS[-2])
+            header = buf[pos]
+            if not header & 0x80 and header & 0x40:
+                end = pos + 6
+                if fill(end):
+                    end += 3 * buf[pos + 5]
+                    if header & 0x20 and fill(end + 1):
+                        end += 1 + 3 * buf[end]
+                if not fill(end) or base + end > data_end:
+                    raise ValueError(_ERRORS[-2])
+                local_type = header & 0x0F
+                definition, pos = read_definition(buf, pos + 1, header)
+                definitions[local_type] = definition
+                yield FitMessage(base + start, base + pos, local_type, True, definition, None), bytes(buf[start:pos])
+                continue
+
+            local_type = (header >> 5) & 0x03 if header & 0x80 else header & 0x0F
+            definition = definitions[local_type]
+            if definition is None:
+                raise ValueError(_ERRORS[-4])
+            pos += 1 + definition.size
+            if not fill(pos) or base + pos > data_end:
+                raise ValueError(_ERRORS[-2])
+            timestamp, last_timestamp = _data_timestamp(buf, start, header, definition, last_timestamp)
+            yield FitMessage(base + start, base + pos, local_type, False, definition, timestamp), bytes(buf[start:pos])
+
+        if not fill(pos + 2):
+            raise ValueError(_ERRORS[-2])
+        if check_crc and crc16(buf[crc_from:pos], crc) != struct.unpack_from('<H', buf, pos)[0]:
+            raise ValueError(_ERRORS[-3])
+        pos += 2
+        if not chained:
+            return
+
+
+def _decode_records_python(buf, field_nums, check_crc):
+    nan = float('nan')
+    columns = [[] for _ in field_nums]
+    for msg in iter_messages(buf, check_crc):
+        definition = msg.definition
+        if msg.is_definition or definition.global_num != MESG_RECORD:
+            continue
+        values = definition.struct.unpack_from(buf, msg.start + 1)
+        for column, num in zip(columns, field_nums):
+            if num == FIELD_TIMESTAMP:
+                column.append(nan if msg.timestamp is None else msg.timestamp)
+                continue
+            scalar = definition.scalars.get(num)
+            if scalar is None:
+                column.append(nan)
+                continue
+            value = values[scalar[0]]
+            column.append(nan if value == scalar[1] else value)
+    return np.array(columns, dtype=np.double).reshape(len(field_nums), -1)
+
+
+def _decode_records_native(buf, field_nums, check_crc):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    nums = np.array(field_nums, dtype=np.uint8)
+    # A record message is at least 2 bytes; start from a typical 1 Hz density
+    capacity = max(16, data.size // 24)
+    while True:
+        out = np.empty(len(field_nums) * capacity, dtype=np.double)
+        count = _lib.fit_decode_records(data, data.size, nums, nums.size, out, capacity, int(check_crc))
+        if count < 0:
+            raise ValueError(_ERRORS.get(count, f"FIT decode failed ({count})."))
+        if count <= capacity:
+            return out.reshape(len(field_nums), capacity)[:, :count]
+        capacity = count
+
+
+def decode_records(source, fields=None, raw=False, check_crc=True, backend=None):
+    """
+    Decodes `record` messages straight into NumPy columns:
+      { field_name: ndarray }
+    'timestamp' is int64 FIT-epoch seconds, other fields float64 with NaN for
+    missing/invalid values, scaled to profile units unless raw=True.
+    source is a path or bytes; fields defaults to every name in RECORD_FIELDS.
+    backend='native' or 'python' forces an implementation; by default the
+    native library is used when it has been built. Both give identical output.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buf = source
+    else:
+        with open(source, 'rb') as f:
+            buf = f.read()
+
+    names = list(RECORD_FIELDS if fields is None else fields)
+    unknown = [n for n in names if n not in RECORD_FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported record fields: {', '.join(unknown)}")
+    field_nums = [RECORD_FIELDS[n][0] for n in names]
+
+    if backend is None:
+        backend = 'native' if _lib is not None else 'python'
+    if backend == 'native':
+        if _lib is None:
+            raise RuntimeError("fit_native library is not built for this platform.")
+        values = _decode_records_native(buf, field_nums, check_crc)
+    elif backend == 'python':
+        values = _decode_records_python(buf, field_nums, check_crc)
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    columns = {}
+    for name, column in zip(names, values):
+        if name == 'timestamp':
+            columns[name] = np.where(np.isnan(column), FIT_TIMESTAMP_INVALID, column).astype(np.int64)
+            continue
+        _, scale, offset = RECORD_FIELDS[name]
+        columns[name] = column.copy() if raw or (scale == 1 and offset == 0) else column / scale - offset
+    return columns
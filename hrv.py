@@ -0,0 +1,217 @@
+"""
+Rolling HRV metrics over an RR interval series, vectorized with NumPy.
+
+    metrics = hrv_metrics(rr_times, rr_ms)              # per beat
+    columns = record_columns(merged)                    # per FIT record
+    write_fit_with_hrv(fit_path, merged, out_path, record_columns=columns)
+
+Every metric is computed over a trailing time window ending at each beat:
+time-domain ones (mean HR, SDNN, RMSSD, pNN50) from cumulative sums, and
+frequency-domain ones (LF, HF, LF/HF) from Welch periodograms of the
+resampled tachogram, all segments transformed in one batch. Artifacts
+(ectopic beats, missed or extra detections) are found against a rolling
+median and interpolated over before anything is computed.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from instrument import stage
+
+DEFAULT_WINDOW = 300.0          # s, trailing window of every metric (5 min, as in short-term HRV)
+ARTIFACT_THRESHOLD = 0.2        # relative deviation from the local median that flags a beat
+ARTIFACT_MEDIAN_BEATS = 11      # beats in the rolling median
+RR_RANGE = (250.0, 2500.0)      # ms, physiologically possible RR intervals
+NN50_MS = 50.0
+
+# Welch: tachogram resampled at TACHOGRAM_HZ, Hann segments of SEGMENT samples, half overlapping
+TACHOGRAM_HZ = 4.0
+SEGMENT = 256
+LF_BAND = (0.04, 0.15)          # Hz
+HF_BAND = (0.15, 0.40)          # Hz
+
+# Metric -> units, in the order record_columns returns them
+METRICS = {
+    'mean_hr': 'bpm',
+    'sdnn': 'ms',
+    'rmssd': 'ms',
+    'pnn50': '%',
+    'lf': 'ms^2',
+    'hf': 'ms^2',
+    'lf_hf': '',
+}
+
+
+def detect_artifacts(rr_ms, threshold=ARTIFACT_THRESHOLD, beats=ARTIFACT_MEDIAN_BEATS):
+    """
+    Boolean mask of artifact beats: outside RR_RANGE, or more than threshold
+    (relative) away from the median of the surrounding beats.
+    """
+    rr = np.asarray(rr_ms, dtype=np.double)
+    if rr.size == 0:
+        return np.zeros(0, dtype=bool)
+    half = beats // 2
+    padded = np.pad(rr, half, mode='edge')
+    median = np.median(sliding_window_view(padded, 2 * half + 1), axis=1)
+    return (rr < RR_RANGE[0]) | (rr > RR_RANGE[1]) | (np.abs(rr - median) > threshold * median)
+
+
+def correct_artifacts(rr_ms, artifacts=None):
+    """
+    RR intervals (float64) with the artifact beats replaced by linear
+    interpolation between the nearest good beats (by beat index).
+    """
+    rr = np.asarray(rr_ms, dtype=np.double).copy()
+    if artifacts is None:
+        artifacts = detect_artifacts(rr)
+    good = ~artifacts
+    if artifacts.any() and good.any():
+        index = np.arange(rr.size)
+        rr[artifacts] = np.interp(index[artifacts], index[good], rr[good])
+    return rr
+
+
+def _window_starts(times, window):
+    # Index of the first beat inside the trailing window ending at each beat
+    return np.searchsorted(times, times - window, side='right')
+
+
+def rolling_time_domain(rr_times, rr_ms, window=DEFAULT_WINDOW):
+    """
+    Per beat, over the beats of the trailing window (t - window, t]:
+    mean_hr (bpm), sdnn and rmssd (ms) and pnn50 (%). Windows with fewer
+    than two beats (or successive differences) give NaN.
+    """
+    times = np.asarray(rr_times, dtype=np.double)
+    rr = np.asarray(rr_ms, dtype=np.double)
+    n = rr.size
+    start = _window_starts(times, window)
+    stop = np.arange(1, n + 1)
+    count = stop - start
+
+    # Centred before summing, so the variance does not cancel catastrophically
+    base = rr.mean() if n else 0.0
+    centred = rr - base
+    c1 = np.concatenate(([0.0], np.cumsum(centred)))
+    c2 = np.concatenate(([0.0], np.cumsum(centred ** 2)))
+    # diff[i] = rr[i] - rr[i - 1]; a window's successive differences are diff[start + 1:stop]
+    diff = np.diff(rr, prepend=rr[:1])
+    d2 = np.concatenate(([0.0], np.cumsum(diff ** 2)))
+    nn50 = np.concatenate(([0], np.cumsum(np.abs(diff) > NN50_MS)))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s1 = c1[stop] - c1[start]
+        var = (c2[stop] - c2[start] - s1 ** 2 / count) / (count - 1)
+        pairs = count - 1
+        metrics = {
+            'mean_hr': 60000.0 / (s1 / count + base),
+            'sdnn': np.sqrt(np.maximum(var, 0.0)),
+            'rmssd': np.sqrt((d2[stop] - d2[start + 1]) / pairs),
+            'pnn50': 100.0 * (nn50[stop] - nn50[start + 1]) / pairs,
+        }
+    few = count < 2
+    for values in metrics.values():
+        values[few] = np.nan
+    return metrics
+
+
+def rolling_frequency_domain(rr_times, rr_ms, window=DEFAULT_WINDOW):
+    """
+    Per beat: lf and hf band powers (ms^2) and lf_hf of the Welch spectrum
+    over the trailing window. The tachogram is resampled at TACHOGRAM_HZ,
+    every half-overlapping Hann segment is transformed in one batch and each
+    window averages the segments it fully contains. NaN until a window holds
+    at least one segment.
+    """
+    times = np.asarray(rr_times, dtype=np.double)
+    rr = np.asarray(rr_ms, dtype=np.double)
+    nan = np.full(times.size, np.nan)
+    empty = {'lf': nan, 'hf': nan.copy(), 'lf_hf': nan.copy()}
+    if times.size < 2 or times[-1] - times[0] < SEGMENT / TACHOGRAM_HZ:
+        return empty
+
+    grid = times[0] + np.arange(int((times[-1] - times[0]) * TACHOGRAM_HZ) + 1) / TACHOGRAM_HZ
+    tachogram = np.interp(grid, times, rr)
+    step = SEGMENT // 2
+    segments = sliding_window_view(tachogram, SEGMENT)[::step]
+    segments = segments - segments.mean(axis=1, keepdims=True)
+    taper = np.hanning(SEGMENT)
+    spectrum = np.abs(np.fft.rfft(segments * taper, axis=1)) ** 2
+    psd = spectrum * 2 / (TACHOGRAM_HZ * (taper ** 2).sum())        # one-sided, ms^2/Hz
+    freqs = np.fft.rfftfreq(SEGMENT, 1 / TACHOGRAM_HZ)
+    df = freqs[1]
+    lf_band = (freqs >= LF_BAND[0]) & (freqs < LF_BAND[1])
+    hf_band = (freqs >= HF_BAND[0]) & (freqs < HF_BAND[1])
+    lf_seg = psd[:, lf_band].sum(axis=1) * df
+    hf_seg = psd[:, hf_band].sum(axis=1) * df
+
+    # Rolling mean over the last `per_window` segments (those inside the window)
+    per_window = max(1, int((window * TACHOGRAM_HZ - SEGMENT) // step) + 1)
+    seg_end = grid[0] + (np.arange(len(segments)) * step + SEGMENT - 1) / TACHOGRAM_HZ
+    c_lf = np.concatenate(([0.0], np.cumsum(lf_seg)))
+    c_hf = np.concatenate(([0.0], np.cumsum(hf_seg)))
+    last = np.searchsorted(seg_end, times, side='right')       # segments finished by each beat
+    first = np.maximum(last - per_window, 0)
+    count = last - first
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lf = (c_lf[last] - c_lf[first]) / count
+        hf = (c_hf[last] - c_hf[first]) / count
+        lf_hf = lf / hf
+    # Until a full window of segments exists, the estimate covers less than the window
+    partial = count < min(per_window, len(segments))
+    for values in (lf, hf, lf_hf):
+        values[partial | (count == 0)] = np.nan
+    return {'lf': lf, 'hf': hf, 'lf_hf': lf_hf}
+
+
+def hrv_metrics(rr_times, rr_ms, window=DEFAULT_WINDOW, correct=True):
+    """
+    Every METRICS entry per beat over the trailing window, plus 'artifact'
+    (the beats that were corrected; all False with correct=False).
+    rr_times must be sorted POSIX seconds, rr_ms the intervals ending there.
+    """
+    rr_times = np.asarray(rr_times, dtype=np.double)
+    artifacts = detect_artifacts(rr_ms) if correct else np.zeros(np.size(rr_ms), dtype=bool)
+    rr = correct_artifacts(rr_ms, artifacts) if correct else np.asarray(rr_ms, dtype=np.double)
+    metrics = rolling_time_domain(rr_times, rr, window)
+    metrics.update(rolling_frequency_domain(rr_times, rr, window))
+    metrics['artifact'] = artifacts
+    return metrics
+
+
+def per_record(record_times, beat_times, values, max_age=DEFAULT_WINDOW):
+    """
+    values (one per beat) carried onto records: each record gets the value
+    of the last beat at or before it, or NaN when there is none within max_age.
+    """
+    record_times = np.asarray(record_times, dtype=np.double)
+    last = np.searchsorted(beat_times, record_times, side='right') - 1
+    out = np.full(record_times.size, np.nan)
+    found = last >= 0
+    out[found] = values[last[found]]
+    stale = found.copy()
+    stale[found] = record_times[found] - beat_times[last[found]] > max_age
+    out[stale] = np.nan
+    return out
+
+
+def record_columns(merged, window=DEFAULT_WINDOW, metrics=tuple(METRICS), correct=True):
+    """
+    HRV metrics per FIT record for a sync.SyncedTable: { metric: float64
+    array with one value per FIT record }. The metrics are computed over the
+    table's whole RR series (moved onto the FIT clock when the table was
+    aligned), so beats outside the sync tolerance still count.
+    """
+    from sync import fit_record_times, rri_times, rri_values
+
+    with stage('hrv', window=window) as s:
+        # Every beat counts, not only the ones matched to a record
+        beat_times = rri_times(merged.rri_series)
+        if merged.alignment is not None:
+            beat_times = merged.alignment.correct(beat_times)
+        rr = np.asarray(rri_values(merged.rri_series), dtype=np.double)
+        order = np.argsort(beat_times, kind='stable')
+        beat_times, rr = beat_times[order], rr[order]
+        beats = hrv_metrics(beat_times, rr, window, correct)
+        record_times = fit_record_times(merged.fit_records)
+        columns = {name: per_record(record_times, beat_times, beats[name], window) for name in metrics}
+        s.count(beats=int(rr.size), records=int(record_times.size), artifacts=int(beats['artifact'].sum()))
+    return columns
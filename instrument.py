@@ -0,0 +1,216 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Configuration from the environment, so process-pool workers inherit it
+METRICS_ENV = 'POLAR_GARMIN_METRICS'              # json | logfmt (unset: off)
+METRICS_FILE_ENV = 'POLAR_GARMIN_METRICS_FILE'    # append events here instead of stderr
+TRACEMALLOC_ENV = 'POLAR_GARMIN_TRACEMALLOC'      # 1: track peak allocation per stage
+PROFILE_ENV = 'POLAR_GARMIN_PROFILE'              # directory for per-stage cProfile dumps
+
+FORMATS = ('json', 'logfmt')
+
+
+class _Config:
+    def __init__(self):
+        self.format = None
+        self.path = None
+        self.trace_memory = False
+        self.profile_dir = None
+        self.lock = threading.Lock()
+        self.profile_seq = 0
+
+    def load_env(self):
+        fmt = os.environ.get(METRICS_ENV, '').lower() or None
+        self.format = fmt if fmt in FORMATS else None
+        self.path = os.environ.get(METRICS_FILE_ENV) or None
+        self.trace_memory = os.environ.get(TRACEMALLOC_ENV, '') not in ('', '0')
+        self.profile_dir = os.environ.get(PROFILE_ENV) or None
+
+
+_config = _Config()
+_config.load_env()
+_local = threading.local()
+
+
+def configure(format=None, path=None, trace_memory=False, profile_dir=None, export=False):
+    """
+    Turns instrumentation on (format 'json' or 'logfmt') or off (None).
+    Events go to path (appended) or stderr. trace_memory adds tracemalloc peak
+    allocation per stage; profile_dir dumps a cProfile per top-level stage.
+    export=True also sets the environment so child processes follow.
+    """
+    if format is not None and format not in FORMATS:
+        raise ValueError(f"Unknown metrics format: {format}")
+    _config.format = format
+    _config.path = path
+    _config.trace_memory = trace_memory
+    _config.profile_dir = profile_dir
+    if export:
+        for name, value in ((METRICS_ENV, format), (METRICS_FILE_ENV, path),
+                            (TRACEMALLOC_ENV, '1' if trace_memory else None), (PROFILE_ENV, profile_dir)):
+            if value:
+                os.environ[name] = value
+            else:
+                os.environ.pop(name, None)
+
+
+def enabled():
+    return _config.format is not None
+
+
+def _logfmt_value(value):
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def emit(event, **fields):
+    """Writes one structured event (no-op while instrumentation is off)."""
+    if _config.format is None:
+        return
+    record = {'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'), 'event': event}
+    record.update(getattr(_local, 'context', {}))
+    record.update(fields)
+    if _config.format == 'json':
+        line = json.dumps(record, default=str)
+    else:
+        line = ' '.join(f"{k}={_logfmt_value(v)}" for k, v in record.items())
+    with _config.lock:
+        if _config.path:
+            with open(_config.path, 'a') as f:
+                f.write(line + '\n')
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+
+@contextmanager
+def context(**fields):
+    """Adds fields (e.g. job=...) to every event emitted by this thread inside the block."""
+    previous = getattr(_local, 'context', {})
+    _local.context = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+class Stage:
+    """
+    A running stage: counters added with count() are reported, with its
+    wall time and (optionally) peak allocation, when the stage ends.
+    """
+
+    __slots__ = ('name', 'counters', 'child_peak')
+
+    def __init__(self, name):
+        self.name = name
+        self.counters = {}
+        self.child_peak = 0
+
+    def count(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def count(self, **counters):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Times a pipeline stage and emits a 'stage' event when it ends:
+
+        with stage('parse_fit', path=path) as s:
+            ...
+            s.count(records=n, bytes_read=size)
+
+    Stages nest; costs almost nothing while instrumentation is off.
+    """
+    if _config.format is None:
+        yield _NULL_STAGE
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Stage(name)
+    top_level = not stack
+
+    trace = _config.trace_memory
+    started_tracing = False
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        base, peak_so_far = tracemalloc.get_traced_memory()
+        if stack:
+            # Keep the enclosing stage's peak before it is reset for this one
+            stack[-1].child_peak = max(stack[-1].child_peak, peak_so_far)
+        tracemalloc.reset_peak()
+    profiler = None
+    if _config.profile_dir and top_level:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # another thread's stage is already being profiled
+
+    stack.append(current)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield current
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        result = {'stage': name, 'status': status, 'seconds': round(seconds, 6)}
+        result.update(fields)
+        result.update(current.counters)
+        if profiler is not None:
+            profiler.disable()
+            result['profile'] = _dump_profile(profiler, name)
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, current.child_peak)
+            result['peak_mb'] = round(max(peak - base, 0) / 2 ** 20, 3)
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            if started_tracing:
+                tracemalloc.stop()
+        emit('stage', **result)
+
+
+def _dump_profile(profiler, name):
+    with _config.lock:
+        _config.profile_seq += 1
+        seq = _config.profile_seq
+    os.makedirs(_config.profile_dir, exist_ok=True)
+    path = os.path.join(_config.profile_dir, f"{name}-{os.getpid()}-{seq}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+def file_size(path):
+    """Bytes on disk, or 0 if path is not a readable file (for byte counters)."""
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
@@ -1,6 +1,10 @@
-from gui import start_gui, garmin_file_path
-from parser_fit import parse_fit_file
+import sys
 
 if __name__ == "__main__":
-    start_gui()
+    # `main.py batch ...` runs the headless batch sync instead of the GUI
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from batch import main
+        sys.exit(main(sys.argv[2:]))
 
+    from gui import start_gui
+    start_gui()
@@ -0,0 +1,36 @@
+import os
+import sys
+import ctypes
+
+# Directories searched for compiled libraries: next to the sources, and the
+# bundle's Resources folder when running from the py2app build.
+_here = os.path.dirname(os.path.abspath(__file__))
+_search_dirs = [_here] + ([os.environ['RESOURCEPATH']] if 'RESOURCEPATH' in os.environ else [])
+
+
+def library_names(name):
+    """
+    Platform-specific file names for the shared library built from <name>.cpp.
+    """
+    if sys.platform == 'win32':
+        return [f"{name}.dll"]
+    if sys.platform == 'darwin':
+        return [f"lib{name}.dylib", f"lib{name}.so"]
+    return [f"lib{name}.so"]
+
+
+def load_library(name):
+    """
+    Loads the first build of <name> found for this platform.
+    Returns None when no artifact exists or none of them can be loaded.
+    """
+    for directory in _search_dirs:
+        for filename in library_names(name):
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                continue
+            try:
+                return ctypes.CDLL(path)
+            except OSError as e:
+                print(f"Could not load {path}: {e}")
+    return None
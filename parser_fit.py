@@ -1,15 +1,146 @@
-import fitdecode
+from datetime import datetime, timezone
+import numbers
+import numpy as np
+from instrument import file_size, stage
+from fit_native import (FIT_EPOCH, FIT_TIMESTAMP_INVALID, MESG_RECORD, RECORD_FIELDS,
+                        decode_records, iter_message_stream)
+
 
 def parse_fit_file(filepath):
+    import fitdecode
+
     records = []
 
+    with stage('parse_fit_file', path=str(filepath)) as s:
+        with fitdecode.FitReader(filepath) as fit:
+            for frame in fit:
+                if frame.frame_type == fitdecode.FIT_FRAME_DATA:
+                    if frame.name == "record":
+                        record = {}
+                        for field in frame.fields:
+                            record[field.name] = field.value
+                        records.append(record)
+        s.count(records=len(records), bytes_read=file_size(filepath))
+
+    return records
+
+
+def _fit_timestamp(field):
+    raw = field.raw_value
+    if isinstance(raw, numbers.Integral):
+        return raw
+    if isinstance(field.value, datetime):
+        return int(field.value.timestamp()) - FIT_EPOCH
+    return FIT_TIMESTAMP_INVALID
+
+
+def _to_array(values):
+    """
+    Numeric columns become float64 with NaN for missing values; anything
+    else (strings, enums, arrays) stays an object array.
+    """
+    if all(v is None or (isinstance(v, numbers.Real) and not isinstance(v, bool)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(values, dtype=object)
+
+
+def parse_fit_columns(filepath, fields=None):
+    """
+    Columnar variant of parse_fit_file: returns { field_name: ndarray } with one
+    entry per `record` message. 'timestamp' is an int64 array of FIT-epoch
+    seconds, numeric fields are float64 (NaN where a record lacks the field).
+    Pass fields (e.g. ('timestamp',)) to decode only those columns; projections
+    over the common record fields go through the native FIT decoder.
+    """
+    with stage('parse_fit_columns', path=str(filepath)) as s:
+        columns = _parse_fit_columns(filepath, fields)
+        s.count(records=int(columns['timestamp'].size) if 'timestamp' in columns else 0,
+                bytes_read=file_size(filepath))
+    return columns
+
+
+def _parse_fit_columns(filepath, fields):
+    if fields is not None and all(name in RECORD_FIELDS for name in fields):
+        columns = decode_records(filepath, fields)
+        return {name: column for name, column in columns.items()
+                if name == 'timestamp' or not np.isnan(column).all()}
+
+    # Fields outside the native decoder's set fall back to fitdecode
+    import fitdecode
+
+    wanted = None if fields is None else set(fields)
+    columns = {}
+    count = 0
+
     with fitdecode.FitReader(filepath) as fit:
         for frame in fit:
-            if frame.frame_type == fitdecode.FIT_FRAME_DATA:
-                if frame.name == "record":
-                    record = {}
-                    for field in frame.fields:
-                        record[field.name] = field.value
-                    records.append(record)
-
-    return records
\ No newline at end of file
+            if frame.frame_type != fitdecode.FIT_FRAME_DATA or frame.name != "record":
+                continue
+            for field in frame.fields:
+                name = field.name
+                if wanted is not None and name not in wanted:
+                    continue
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = [None] * count
+                elif len(column) > count:
+                    # repeated field name within one message: keep the first
+                    continue
+                column.append(_fit_timestamp(field) if name == 'timestamp' else field.value)
+            count += 1
+            for column in columns.values():
+                if len(column) < count:
+                    column.append(None)
+
+    result = {}
+    for name, values in columns.items():
+        if name == 'timestamp':
+            result[name] = np.array(
+                [FIT_TIMESTAMP_INVALID if v is None else v for v in values], dtype=np.int64)
+        else:
+            result[name] = _to_array(values)
+    if wanted is not None and 'timestamp' in wanted and 'timestamp' not in result:
+        result['timestamp'] = np.full(count, FIT_TIMESTAMP_INVALID, dtype=np.int64)
+    return result
+
+
+def iter_fit_timestamps(source, chunk_size=65536, check_crc=True):
+    """
+    Streaming variant of parse_fit_columns(source, ('timestamp',)): yields
+    { 'timestamp': int64 ndarray } chunks of up to chunk_size records while
+    the file is read incrementally. source is a path or a binary file object,
+    so a file can be processed while it is still being uploaded.
+    """
+    chunk = []
+    for msg, _ in iter_message_stream(source, check_crc):
+        if msg.is_definition or msg.definition.global_num != MESG_RECORD:
+            continue
+        chunk.append(FIT_TIMESTAMP_INVALID if msg.timestamp is None else msg.timestamp)
+        if len(chunk) >= chunk_size:
+            yield {'timestamp': np.array(chunk, dtype=np.int64)}
+            chunk = []
+    if chunk:
+        yield {'timestamp': np.array(chunk, dtype=np.int64)}
+
+
+def fit_posix_times(columns):
+    """POSIX seconds (float64) for the 'timestamp' column of parse_fit_columns."""
+    return (columns['timestamp'] + FIT_EPOCH).astype(np.double)
+
+
+def column_record(columns, index):
+    """
+    Rebuilds the parse_fit_file dict for one row of parse_fit_columns output.
+    Missing (NaN/None) fields are left out.
+    """
+    record = {}
+    for name, column in columns.items():
+        value = column[index]
+        if name == 'timestamp':
+            value = datetime.fromtimestamp(int(value) + FIT_EPOCH, tz=timezone.utc)
+        elif value is None or (isinstance(value, float) and np.isnan(value)):
+            continue
+        elif isinstance(value, np.generic):
+            value = value.item()
+        record[name] = value
+    return record
@@ -1,82 +1,255 @@
 import struct
 import json
-from datetime import datetime, timedelta
+import mmap
+from datetime import datetime, timezone
+import numpy as np
+from instrument import file_size, stage
 
+# struct format characters whose NumPy code differs under standard '<' sizes
+_NUMPY_CODES = {'l': 'i4', 'L': 'u4'}
 
-def parse_kdf_file(filepath, channel_type="RRI"):
+
+def _channel_dtype(data_enc):
     """
-    Parses the KDF file and returns a dict of channels. Each channel is:
-      { 'type': <type>, 'data': [ {timestamp: datetime, <field>: value}, ... ] }
+    Packed little-endian structured dtype equivalent to the channel's
+    struct format '<' + ''.join(types).
     """
-    parsed_data = {}
+    return np.dtype([(name, '<' + _NUMPY_CODES.get(ft, ft)) for name, ft in data_enc])
 
-    with open(filepath, 'rb') as f:
-        # Read file identifier and version
-        identifier = f.read(7).decode('ascii')
-        _ = f.read(3)
 
-        # Read header size and header
-        header_size = struct.unpack('<I', f.read(4))[0]
-        header_bytes = f.read(header_size)
-        if identifier == "KDFJSON":
-            header = json.loads(header_bytes.decode('utf-8'))
-        else:
-            raise ValueError("Currently only JSON headers are supported.")
+def _rr_timestamps(start_time, rr, offset_ns=0):
+    """
+    Cumulative-sum timestamps (datetime64[ns]) for an RR/PP interval column
+    given in milliseconds, continuing offset_ns after start_time (for chunks).
+    Aware start times are expressed in UTC.
+    """
+    if start_time.tzinfo is not None:
+        start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+    start = np.datetime64(start_time, 'ns')
+    if rr.dtype.kind in 'iub':
+        offsets_ns = np.cumsum(rr, dtype=np.int64) * 1_000_000
+    else:
+        # timedelta(milliseconds=rr) rounds each interval to whole microseconds
+        offsets_ns = np.cumsum(np.round(rr.astype(np.float64) * 1000).astype(np.int64)) * 1000
+    return start + (offsets_ns + offset_ns).astype('timedelta64[ns]')
+
+
+def _decode_channel(channel, raw, start_time):
+    """
+    Decodes one channel's raw bytes into its columnar form.
+    """
+    data_enc = channel['data_enc']
+
+    # JSON list type (Markers)
+    if data_enc == "list":
+        return {
+            'type': channel['type'],
+            'data': json.loads(bytes(raw).decode('utf-8')),
+            'timestamps': None,
+        }
+
+    data = np.frombuffer(raw, dtype=_channel_dtype(data_enc), count=channel['total_values'])
+    timestamps = None
+    if channel['type'] in ('RRI', 'PPI'):
+        timestamps = _rr_timestamps(start_time, data[data.dtype.names[0]])
+    return {
+        'type': channel['type'],
+        'data': data,
+        'timestamps': timestamps,
+        'start_time': start_time,
+    }
+
+
+class KdfFile:
+    """
+    Lazily decoded view of a KDF file. The JSON header is parsed once and the
+    file is memory-mapped; a channel's bytes are only touched (zero-copy) the
+    first time that channel is accessed by label:
+
+        with KdfFile(path) as kdf:
+            rri = kdf['RRI']
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._decoded = {}
+
+        with open(filepath, 'rb') as f:
+            # Read file identifier and version
+            identifier = f.read(7).decode('ascii')
+            _ = f.read(3)
+
+            # Read header size and header
+            header_size = struct.unpack('<I', f.read(4))[0]
+            header_bytes = f.read(header_size)
+            if identifier == "KDFJSON":
+                self.header = json.loads(header_bytes.decode('utf-8'))
+            else:
+                raise ValueError("Currently only JSON headers are supported.")
+
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
         # Determine start time
-        start_time_str = header.get('measured_timestamp', header.get('create_timestamp'))
+        start_time_str = self.header.get('measured_timestamp', self.header.get('create_timestamp'))
         if not start_time_str:
+            self.close()
             raise ValueError("No timestamp found in header.")
         # Parse ISO8601 into datetime
-        start_time = datetime.fromisoformat(start_time_str)
+        self.start_time = datetime.fromisoformat(start_time_str)
 
         # Normalize channels to list
-        channels = header.get('channels', [])
+        channels = self.header.get('channels', [])
         if isinstance(channels, dict):
             channels = [channels]
+        self.channels = {ch.get('label', 'Unnamed_Channel'): ch for ch in channels}
 
-        header_end = 14 + header_size
+        self._header_end = 14 + header_size
 
-        # Iterate each channel
-        for channel in channels:
-            label = channel.get('label', 'Unnamed_Channel')
-            data_enc = channel['data_enc']
-            data_url = channel['data_url']
-            data_size = channel['data_size']
-            data_start = header_end + data_url
+    @property
+    def labels(self):
+        return list(self.channels)
 
-            f.seek(data_start)
-            raw = f.read(data_size)
+    def __contains__(self, label):
+        return label in self.channels
 
-            # JSON list type (Markers)
-            if data_enc == "list":
-                channel_data = json.loads(raw.decode('utf-8'))
-            else:
-                # Build struct format
-                fmt = '<' + ''.join(ft for _, ft in data_enc)
-                size = struct.calcsize(fmt)
-                count = channel['total_values']
-                points = [struct.unpack_from(fmt, raw, offset=i*size) for i in range(count)]
-                names = [fn for fn, _ in data_enc]
-
-                # Handle RR-type with datetime
-                if channel['type'] in ('RRI', 'PPI'):
-                    current = start_time
-                    channel_data = []
-                    for pt in points:
-                        rr = pt[0]
-                        current += timedelta(milliseconds=rr)
-                        channel_data.append({
-                            'timestamp': current,
-                            names[0]: rr
-                        })
-                else:
-                    # Other channels: no timestamps
-                    channel_data = [dict(zip(names, pt)) for pt in points]
-
-            parsed_data[label] = {
+    def __getitem__(self, label):
+        """
+        Columnar channel (see parse_kdf_columns), decoded on first access.
+        Numeric data is a read-only view into the mapped file.
+        """
+        if label not in self._decoded:
+            channel = self.channels[label]
+            start = self._header_end + channel['data_url']
+            raw = memoryview(self._mmap)[start:start + channel['data_size']]
+            self._decoded[label] = _decode_channel(channel, raw, self.start_time)
+        return self._decoded[label]
+
+    def get(self, label, default=None):
+        return self[label] if label in self.channels else default
+
+    def iter_chunks(self, label, chunk_size=65536):
+        """
+        Yields a numeric channel as columnar chunks of up to chunk_size values,
+        shaped like self[label]. Data are views into the mapped file and RRI/PPI
+        timestamps continue across chunks, so memory stays bounded by the chunk.
+        """
+        channel = self.channels[label]
+        if channel['data_enc'] == "list":
+            raise ValueError(f"Channel {label} is not numeric.")
+        dtype = _channel_dtype(channel['data_enc'])
+        start = self._header_end + channel['data_url']
+        raw = memoryview(self._mmap)[start:start + channel['data_size']]
+        total = channel['total_values']
+        tz = self.start_time.tzinfo
+        origin = np.datetime64(
+            self.start_time.astimezone(timezone.utc).replace(tzinfo=None) if tz else self.start_time, 'ns')
+        offset_ns = 0
+        for first in range(0, total, chunk_size):
+            data = np.frombuffer(raw, dtype=dtype, count=min(chunk_size, total - first),
+                                 offset=first * dtype.itemsize)
+            timestamps = None
+            if channel['type'] in ('RRI', 'PPI'):
+                timestamps = _rr_timestamps(self.start_time, data[dtype.names[0]], offset_ns)
+                offset_ns = int((timestamps[-1] - origin).astype(np.int64))
+            yield {
                 'type': channel['type'],
-                'data': channel_data
+                'data': data,
+                'timestamps': timestamps,
+                'start_time': self.start_time,
             }
 
-    return parsed_data
+    def close(self):
+        self._decoded = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Decoded arrays handed out to callers still reference the mapping;
+            # it is released once the last of them is garbage collected.
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_kdf_columns(filepath, labels=None):
+    """
+    Columnar variant of parse_kdf_file. Each channel is:
+      { 'type': <type>, 'data': <structured ndarray>, 'timestamps': <datetime64[ns] ndarray or None>,
+        'start_time': <datetime> }
+    RRI/PPI channels get cumulative-sum timestamps (UTC for offset-aware headers);
+    list-encoded channels (Markers) keep their decoded JSON in 'data'.
+    Pass labels to decode only the listed channels.
+    """
+    with stage('parse_kdf_columns', path=str(filepath)) as s, KdfFile(filepath) as kdf:
+        wanted = kdf.labels if labels is None else [l for l in labels if l in kdf]
+        channels = {label: kdf[label] for label in wanted}
+        rri = channels.get('RRI')
+        s.count(channels=len(channels), bytes_read=file_size(filepath),
+                rr_intervals=len(rri['data']) if rri else 0)
+        return channels
+
+
+def iter_kdf_chunks(filepath, label="RRI", chunk_size=65536):
+    """
+    Streams one channel of a KDF file as columnar chunks (see KdfFile.iter_chunks).
+    """
+    with KdfFile(filepath) as kdf:
+        if label not in kdf:
+            raise ValueError(f"No {label} channel in {filepath}")
+        yield from kdf.iter_chunks(label, chunk_size)
+
+
+def channel_posix_times(channel):
+    """
+    POSIX seconds (float64) for an RRI/PPI channel, matching datetime.timestamp()
+    on the rows of channel_records (naive header times are local time).
+    """
+    start_time = channel['start_time']
+    tz = start_time.tzinfo
+    utc_start = start_time.astimezone(timezone.utc).replace(tzinfo=None) if tz else start_time
+    offsets = (channel['timestamps'] - np.datetime64(utc_start, 'ns')).astype(np.int64)
+    return start_time.timestamp() + offsets / 1e9
+
+
+def channel_records(channel):
+    """
+    Expands a columnar channel into the legacy list of dicts:
+    RRI/PPI rows are {timestamp: datetime, <field>: value}, other rows map
+    every field name to its value.
+    """
+    data = channel['data']
+    if not isinstance(data, np.ndarray):
+        return data
+
+    names = data.dtype.names
+    if channel['timestamps'] is None:
+        columns = [data[name].tolist() for name in names]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    # Rebuild wall-clock datetimes in the header's own timezone
+    start_time = channel['start_time']
+    tz = start_time.tzinfo
+    utc_start = start_time.astimezone(timezone.utc).replace(tzinfo=None) if tz else start_time
+    local = (np.datetime64(start_time.replace(tzinfo=None), 'us')
+             + (channel['timestamps'] - np.datetime64(utc_start, 'ns')).astype('timedelta64[us]'))
+    stamps = local.tolist()
+    if tz is not None:
+        stamps = [ts.replace(tzinfo=tz) for ts in stamps]
+    first = names[0]
+    return [{'timestamp': ts, first: value} for ts, value in zip(stamps, data[first].tolist())]
+
+
+def parse_kdf_file(filepath, channel_type="RRI", labels=None):
+    """
+    Parses the KDF file and returns a dict of channels. Each channel is:
+      { 'type': <type>, 'data': [ {timestamp: datetime, <field>: value}, ... ] }
+    Thin adapter over parse_kdf_columns for callers that need Python rows.
+    """
+    with stage('parse_kdf_file', path=str(filepath)):
+        return {
+            label: {'type': channel['type'], 'data': channel_records(channel)}
+            for label, channel in parse_kdf_columns(filepath, labels).items()
+        }
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import namedtuple
+from instrument import emit
+
+ProgressEvent = namedtuple('ProgressEvent', ['stage', 'done', 'total', 'message'])
+ProgressEvent.__doc__ = """
+Progress of one pipeline stage: done out of total units (total is None
+when unknown) and an optional short message, e.g. the current timestamp.
+"""
+
+DEFAULT_INTERVAL = 0.1   # seconds between coalesced updates (10 Hz)
+
+
+class ProgressReporter:
+    """
+    Progress channel shared by the GUI and headless runs. Pipeline code
+    reports real stage completion from any thread:
+
+        progress.begin('sync', total=n)
+        progress.update(i, message=...)   # as often as convenient
+        progress.end()
+
+    Sinks (callables taking a ProgressEvent) see begin() and end() right
+    away, but update()/advance() calls are coalesced: at most one event per
+    interval, always carrying the latest state. Sinks run on the reporting
+    thread, in order, so they should be quick: a GUI sink hands the event
+    over to its own loop.
+    """
+
+    def __init__(self, *sinks, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self._sinks = list(sinks)
+        self._lock = threading.RLock()
+        self._stage = None
+        self._done = 0
+        self._total = None
+        self._message = None
+        self._last_emit = 0.0
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def begin(self, stage, total=None, message=None):
+        """Starts a stage; the previous one (if any) is considered finished."""
+        with self._lock:
+            self._stage, self._done, self._total, self._message = stage, 0, total, message
+            self._emit()
+
+    def update(self, done, message=None):
+        """Sets the units done in the current stage."""
+        with self._lock:
+            self._done = done
+            if message is not None:
+                self._message = message
+            if time.monotonic() - self._last_emit >= self.interval:
+                self._emit()
+
+    def advance(self, count=1, message=None):
+        """Adds count units to the current stage."""
+        with self._lock:
+            self._done += count
+            if message is not None:
+                self._message = message
+            if time.monotonic() - self._last_emit >= self.interval:
+                self._emit()
+
+    def end(self, message=None):
+        """Finishes the current stage (done = total when the total is known)."""
+        with self._lock:
+            if self._total is not None:
+                self._done = self._total
+            if message is not None:
+                self._message = message
+            self._emit()
+
+    @property
+    def snapshot(self):
+        """Latest state as a ProgressEvent, for sinks that poll instead."""
+        with self._lock:
+            return ProgressEvent(self._stage, self._done, self._total, self._message)
+
+    def _emit(self):
+        # Called with the lock held, which keeps events in order across threads
+        self._last_emit = time.monotonic()
+        event = ProgressEvent(self._stage, self._done, self._total, self._message)
+        for sink in self._sinks:
+            sink(event)
+
+
+class _NullProgress:
+    """Stand-in when nobody listens; every call is a no-op."""
+
+    __slots__ = ()
+
+    def begin(self, stage, total=None, message=None):
+        pass
+
+    def update(self, done, message=None):
+        pass
+
+    def advance(self, count=1, message=None):
+        pass
+
+    def end(self, message=None):
+        pass
+
+
+NULL_PROGRESS = _NullProgress()
+
+
+def metrics_sink(event):
+    """Headless sink: a structured 'progress' event (see instrument.emit)."""
+    emit('progress', **{k: v for k, v in event._asdict().items() if v is not None})
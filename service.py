@@ -0,0 +1,285 @@
+"""
+Asyncio job service: sync (FIT + KDF -> FIT with RR) and multisport split
+jobs for upload pipelines, without the GUI.
+
+    async with JobService(workers=4, limits={'sync': 3, 'split': 1}) as service:
+        job = service.submit_sync(fit_path, kdf_path, output_fit)
+        async for event in job.events():
+            print(event)
+        result = await job.wait()
+
+Each job runs in one worker of a bounded process pool shared by all jobs;
+each job type has its own concurrency limit. Jobs report a ProgressEvent
+when they start and finish and can be cancelled (a job already running in
+a worker finishes there, but its output is removed).
+
+Locally, jobs can be run from a JSON-lines file:
+
+    python service.py jobs.jsonl     # {"kind": "sync", "fit": ..., "kdf": ..., "output": ...}
+                                     # {"kind": "split", "fit": ..., "output": ...}
+
+Jobs reuse the pipeline: core.sync_files (cache-backed parsers,
+sync_rr_to_fit_cpp, write_fit_with_hrv) and core.split_file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from progress import ProgressEvent
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+
+DEFAULT_LIMITS = {'sync': 4, 'split': 1}
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class Job:
+    """
+    A submitted job. Read its state from status/result/error, follow its
+    progress with `async for event in job.events()` and get the result (or
+    the job's exception) with `await job.wait()`.
+    """
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.task = None
+        self._history = []
+        self._listeners = []
+
+    def _report(self, stage, done=0, total=None, message=None):
+        event = ProgressEvent(stage, done, total, message)
+        self._history.append(event)
+        for queue in self._listeners:
+            queue.put_nowait(event)
+
+    def _finish(self):
+        for queue in self._listeners:
+            queue.put_nowait(None)
+
+    async def events(self):
+        """Yields every ProgressEvent of the job (earlier ones first) until it finishes."""
+        queue = asyncio.Queue()
+        for event in self._history:
+            queue.put_nowait(event)
+        if self.status in (DONE, FAILED, CANCELLED):
+            queue.put_nowait(None)
+        else:
+            self._listeners.append(queue)
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            if queue in self._listeners:
+                self._listeners.remove(queue)
+
+    async def wait(self):
+        """The job's result dict; raises its error, or CancelledError."""
+        return await asyncio.shield(self.task)
+
+    def cancel(self):
+        """Requests cancellation; returns False if the job already finished."""
+        return self.task.cancel()
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'status': self.status,
+                **self.params, 'result': self.result, 'error': self.error}
+
+
+class JobService:
+    """
+    Runs sync and split jobs on a bounded process pool. limits caps the
+    jobs of each kind that run at once; more are queued in submit order.
+    """
+
+    def __init__(self, workers=None, limits=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.jobs = {}
+        self._pool = None
+        self._slots = {}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = {kind: asyncio.Semaphore(limit) for kind, limit in self.limits.items()}
+
+    async def close(self, cancel=False):
+        """Waits for (or with cancel=True, cancels) every job, then stops the pool."""
+        tasks = [job.task for job in self.jobs.values() if not job.task.done()]
+        if cancel:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def submit_sync(self, fit_path, kdf_path, output_fit, max_tolerance=None):
+        """Queues a sync job: RR intervals from kdf_path embedded into a copy of fit_path."""
+        params = {'fit': str(fit_path), 'kdf': str(kdf_path), 'output': str(output_fit)}
+        if max_tolerance is not None:
+            params['max_tolerance'] = max_tolerance
+        return self._submit('sync', params, self._run_sync)
+
+    def submit_split(self, fit_path, output_fit):
+        """Queues a split job: one file per sport segment and transition, named after output_fit."""
+        return self._submit('split', {'fit': str(fit_path), 'output': str(output_fit)}, self._run_split)
+
+    def _submit(self, kind, params, run):
+        if self._pool is None:
+            raise RuntimeError("JobService is not started.")
+        job = Job(kind, params)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, run))
+        self.jobs[job.id] = job
+        return job
+
+    async def _run(self, job, run):
+        start = time.perf_counter()
+        try:
+            async with self._slots[job.kind]:
+                job.status = RUNNING
+                job.result = await run(job)
+            job.result['seconds'] = round(time.perf_counter() - start, 3)
+            job.status = DONE
+            return job.result
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            job._report(job.status)
+            job._finish()
+
+    async def _run_sync(self, job):
+        p = job.params
+        Path(p['output']).parent.mkdir(parents=True, exist_ok=True)
+        partial = p['output'] + '.part'
+        job._report('sync', 0, None)
+        # Parse, sync and write in one worker: the sync itself is far cheaper than shipping
+        # the parsed columns and the synced table between processes
+        future = self._pool.submit(_sync_job, p['fit'], p['kdf'], partial, p.get('max_tolerance'))
+        try:
+            result = await asyncio.wrap_future(future)
+            os.replace(partial, p['output'])
+        except BaseException:
+            # Cancelling does not stop a running worker: drop the partial file once it is done
+            future.add_done_callback(lambda _: _remove(partial))
+            raise
+        job._report('sync', result['rr_intervals'], result['rr_intervals'])
+        return result
+
+    async def _run_split(self, job):
+        from core import split_file
+
+        p = job.params
+        output = Path(p['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        # The outputs are written next to each other in a staging directory and moved over on success
+        staging = output.parent / f".{output.stem}.{job.id}.part"
+        staging.mkdir()
+        job._report('split', 0, None)
+        # Parse and write in one worker, so the decoded activity is not shipped between processes
+        future = self._pool.submit(split_file, p['fit'], str(staging / output.name), 1)
+        try:
+            count = await asyncio.wrap_future(future)
+            for written in sorted(staging.iterdir()):
+                os.replace(written, output.parent / written.name)
+        except BaseException:
+            future.add_done_callback(lambda _: shutil.rmtree(staging, ignore_errors=True))
+            raise
+        staging.rmdir()
+        job._report('split', count, count)
+        return {'outputs': count}
+
+
+def _sync_job(fit_path, kdf_path, output_fit, max_tolerance):
+    # Runs in a pool worker; only the counts go back to the event loop
+    from core import sync_files
+
+    merged = sync_files(fit_path, kdf_path, output_fit, max_tolerance=max_tolerance)
+    return {'records': int(merged.fit_records['timestamp'].size), 'rr_intervals': len(merged)}
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def run_jobs(specs, workers=None, limits=None):
+    """Runs job specs (dicts as in a jobs file) and prints their events; returns the jobs."""
+    async with JobService(workers, limits) as service:
+        jobs = []
+        for spec in specs:
+            if spec['kind'] == 'sync':
+                jobs.append(service.submit_sync(spec['fit'], spec['kdf'], spec['output'],
+                                                spec.get('max_tolerance')))
+            elif spec['kind'] == 'split':
+                jobs.append(service.submit_split(spec['fit'], spec['output']))
+            else:
+                raise ValueError(f"Unknown job kind: {spec['kind']}")
+
+        async def follow(job):
+            async for event in job.events():
+                total = f"/{event.total}" if event.total is not None else ''
+                print(f"[{job.id}] {job.kind} {event.stage} {event.done}{total}")
+
+        await asyncio.gather(*(follow(job) for job in jobs))
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+        return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='service', description="Run sync/split jobs through the job service.")
+    parser.add_argument('jobs', help="JSON-lines file, one job per line")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument('--sync-limit', type=int, default=DEFAULT_LIMITS['sync'], help="concurrent sync jobs")
+    parser.add_argument('--split-limit', type=int, default=DEFAULT_LIMITS['split'], help="concurrent split jobs")
+    args = parser.parse_args(argv)
+
+    with open(args.jobs) as f:
+        specs = [json.loads(line) for line in f if line.strip()]
+    # Relative paths are relative to the jobs file, as in batch manifests
+    base = Path(args.jobs).parent
+    for spec in specs:
+        for key in ('fit', 'kdf', 'output'):
+            if key in spec:
+                spec[key] = str(base / spec[key])
+    jobs = asyncio.run(run_jobs(specs, args.workers, {'sync': args.sync_limit, 'split': args.split_limit}))
+    for job in jobs:
+        print(json.dumps(job.to_dict()))
+    return EXIT_FAILURES if any(job.status != DONE for job in jobs) else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,13 +3,16 @@ from setuptools import setup
 APP = ['main.py']
 DATA_FILES = [
     'FitCSVTool.jar',  # your Java splitter tool
-    # 'libsync.so' will be generated in CI and bundled automatically
+    'FitCsvWorker.java',  # persistent FitCSVTool worker (csvtool_worker.py)
+    # 'libsync.so' and 'libfit_native.so' will be generated in CI and bundled automatically
 ]
 OPTIONS = {
     'argv_emulation': True,
     'includes': [
         'gui', 'sync', 'divider',
-        'parser_fit', 'parser_kdf', 'writer_fit'
+        'parser_fit', 'parser_kdf', 'writer_fit',
+        'native', 'fit_native', 'csvtool_worker', 'batch', 'instrument',
+        'cache', 'fit_encoder', 'core', 'progress', 'align', 'hrv'
     ],
     'packages': [
         'fitparse', 'fitdecode', 'fit_tool', 'numpy'
@@ -39,4 +39,120 @@ EXPORT void sync_rr_to_fit(const double* rr_times,
     }
 }
 
+/**
+ * Index of the FIT timestamp nearest to t in a sorted fit_times array, with
+ * the same tie-breaking as the two-pointer walk: the last index among equally
+ * close timestamps.
+ */
+static size_t nearest_index(const double* fit_times, size_t fit_count, double t)
+{
+    // k = first index with fit_times[k] > t
+    size_t lo = 0, hi = fit_count;
+    while (lo < hi) {
+        size_t mid = lo + (hi - lo) / 2;
+        if (fit_times[mid] <= t) lo = mid + 1; else hi = mid;
+    }
+    size_t k = lo;
+    if (k == fit_count) return k - 1;
+    if (k > 0 && fabs(fit_times[k] - t) > fabs(fit_times[k - 1] - t)) return k - 1;
+
+    // Move to the last duplicate of fit_times[k]
+    double v = fit_times[k];
+    lo = k; hi = fit_count;
+    while (lo < hi) {
+        size_t mid = lo + (hi - lo) / 2;
+        if (fit_times[mid] <= v) lo = mid + 1; else hi = mid;
+    }
+    return lo - 1;
+}
+
+/**
+ * Sync RR intervals to sorted FIT timestamps with a tolerance window.
+ * Sorted rr_times take the O(n+m) two-pointer path; otherwise each RR is
+ * placed by binary search. out_idx[i] is the nearest FIT index and
+ * out_matched[i] is 1 when |fit_times[out_idx[i]] - rr_times[i]| <= max_tolerance
+ * (a negative max_tolerance matches everything).
+ * Returns 1 for the linear path, 0 for binary search, -1 on invalid arguments.
+ */
+EXPORT int sync_rr_to_fit_tol(const double* rr_times,
+                              size_t rr_count,
+                              const double* fit_times,
+                              size_t fit_count,
+                              double max_tolerance,
+                              size_t* out_idx,
+                              unsigned char* out_matched)
+{
+    if (!rr_times || !fit_times || !out_idx || !out_matched) return -1;
+    if (fit_count == 0) {
+        for (size_t i = 0; i < rr_count; ++i) { out_idx[i] = 0; out_matched[i] = 0; }
+        return -1;
+    }
+
+    int sorted = 1;
+    for (size_t i = 1; i < rr_count; ++i) {
+        if (rr_times[i] < rr_times[i - 1]) { sorted = 0; break; }
+    }
+
+    if (sorted) {
+        size_t j = 0;
+        for (size_t i = 0; i < rr_count; ++i) {
+            double t = rr_times[i];
+            while (j + 1 < fit_count &&
+                   fabs(fit_times[j + 1] - t) <= fabs(fit_times[j] - t)) {
+                ++j;
+            }
+            out_idx[i] = j;
+        }
+    } else {
+        for (size_t i = 0; i < rr_count; ++i) {
+            out_idx[i] = nearest_index(fit_times, fit_count, rr_times[i]);
+        }
+    }
+
+    for (size_t i = 0; i < rr_count; ++i) {
+        out_matched[i] = max_tolerance < 0 ||
+                         fabs(fit_times[out_idx[i]] - rr_times[i]) <= max_tolerance;
+    }
+    return sorted;
+}
+
+/**
+ * Streaming step of the two-pointer sync, for FIT and RR timestamps that
+ * arrive in chunks. fit_times is the window of FIT timestamps received so
+ * far, starting at the caller's window base, and *cursor is the two-pointer
+ * position within it, carried from one call to the next.
+ * RR intervals are synced in order until one could still move on to a FIT
+ * timestamp that has not arrived yet; with fit_final set every RR is synced.
+ * Gives the same out_idx (relative to the window) as sync_rr_to_fit over
+ * the whole arrays. Returns the number of RR intervals synced, -1 on
+ * invalid arguments.
+ */
+EXPORT long long sync_rr_to_fit_stream(const double* rr_times,
+                                       size_t rr_count,
+                                       const double* fit_times,
+                                       size_t fit_count,
+                                       int fit_final,
+                                       size_t* cursor,
+                                       size_t* out_idx)
+{
+    if (!rr_times || !fit_times || !cursor || !out_idx) return -1;
+    if (fit_count == 0) return 0;
+    if (*cursor >= fit_count) return -1;
+
+    size_t j = *cursor;
+    size_t i = 0;
+    for (; i < rr_count; ++i) {
+        double t = rr_times[i];
+        while (j + 1 < fit_count &&
+               fabs(fit_times[j + 1] - t) <= fabs(fit_times[j] - t)) {
+            ++j;
+        }
+        // The next FIT timestamp may still be closer: wait for more input
+        if (j + 1 == fit_count && !fit_final) break;
+        out_idx[i] = j;
+    }
+    *cursor = j;
+    return (long long)i;
+}
+
 } // extern "C"
@@ -1,46 +1,436 @@
-import os
 import ctypes
 import numpy as np
+from collections import namedtuple
+from collections.abc import Mapping, Sequence
+from instrument import stage
+from native import load_library
+from parser_fit import fit_posix_times, column_record
+from parser_kdf import channel_posix_times, channel_records
 
-# Load the compiled library
-_here = os.path.dirname(__file__)
-_lib_path = os.path.join(_here, "sync.dll")    # or "libsync.so" on Unix
-_lib = ctypes.CDLL(_lib_path)
-
-# Tell ctypes the function signature
-_lib.sync_rr_to_fit.argtypes = [
-    np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),  # rr_times
-    ctypes.c_size_t,                                                # rr_count
-    np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),  # fit_times
-    ctypes.c_size_t,                                                # fit_count
-    np.ctypeslib.ndpointer(dtype=ctypes.c_size_t, flags="C_CONTIGUOUS")  # out_idx
-]
-_lib.sync_rr_to_fit.restype = None
-
-def sync_rr_to_fit_cpp(fit_records, rri_series):
-    """
-    fit_records: list of dicts, each record['timestamp'] is a datetime
-    rri_series:  list of dicts, each record['timestamp'] is datetime, record['value'] is RR ms
-    Returns merged list of dicts (FIT fields + 'rr_interval_ms' + 'rr_timestamp').
-    """
-    # Build numpy arrays of POSIX times
-    rr_times  = np.array([r['timestamp'].timestamp() for r in rri_series], dtype=np.double)
-    fit_times = np.array([r['timestamp'].timestamp() for r in fit_records], dtype=np.double)
-
-    # Prepare output index array
-    out_idx = np.empty(rr_times.size, dtype=np.uintp)
-
-    # Call the C++ sync
-    _lib.sync_rr_to_fit(rr_times, rr_times.size,
-                        fit_times, fit_times.size,
-                        out_idx)
-
-    # Merge results back into Python dicts
-    synced = []
-    for i, j in enumerate(out_idx):
-        rec = fit_records[int(j)].copy()
-        rec['rr_interval_ms'] = rri_series[i]['value']
-        rec['rr_timestamp']   = rri_series[i]['timestamp']
-        synced.append(rec)
-
-    return synced
+# --- Native library (optional) ---
+# sync.dll on Windows, libsync.so / libsync.dylib elsewhere (make libsync.so);
+# without it every entry point runs on the NumPy fallback.
+_lib = load_library("sync")
+
+# Tolerance-window entry point (every whole-series sync goes through it); older
+# prebuilt libraries may not export it and run on the NumPy fallback instead
+_has_tol = _lib is not None and hasattr(_lib, 'sync_rr_to_fit_tol')
+if _has_tol:
+    _lib.sync_rr_to_fit_tol.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),      # rr_times
+        ctypes.c_size_t,                                                    # rr_count
+        np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),      # fit_times
+        ctypes.c_size_t,                                                    # fit_count
+        ctypes.c_double,                                                    # max_tolerance
+        np.ctypeslib.ndpointer(dtype=ctypes.c_size_t, flags="C_CONTIGUOUS"),  # out_idx
+        np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS"),       # out_matched
+    ]
+    _lib.sync_rr_to_fit_tol.restype = ctypes.c_int
+
+# Streaming step with a carried cursor; same fallback rule as above
+_has_stream = _lib is not None and hasattr(_lib, 'sync_rr_to_fit_stream')
+if _has_stream:
+    _lib.sync_rr_to_fit_stream.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),      # rr_times
+        ctypes.c_size_t,                                                    # rr_count
+        np.ctypeslib.ndpointer(dtype=np.double, flags="C_CONTIGUOUS"),      # fit_times (window)
+        ctypes.c_size_t,                                                    # fit_count
+        ctypes.c_int,                                                       # fit_final
+        ctypes.POINTER(ctypes.c_size_t),                                    # cursor (in/out)
+        np.ctypeslib.ndpointer(dtype=ctypes.c_size_t, flags="C_CONTIGUOUS"),  # out_idx
+    ]
+    _lib.sync_rr_to_fit_stream.restype = ctypes.c_longlong
+
+BACKENDS = ('native', 'numpy')
+
+
+def _resolve_backend(backend):
+    # None picks the native library when it loaded; 'numpy' forces the fallback
+    if backend is None:
+        return 'native' if _lib is not None else 'numpy'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == 'native' and _lib is None:
+        raise RuntimeError("sync library is not built for this platform.")
+    return backend
+
+
+def fit_record_times(fit_records):
+    """
+    POSIX seconds (float64) of FIT records: columnar records from
+    parser_fit.parse_fit_columns, or a list of record dicts.
+    """
+    if isinstance(fit_records, dict):
+        return fit_posix_times(fit_records)
+    return np.array([r['timestamp'].timestamp() for r in fit_records], dtype=np.double)
+
+
+def rri_times(rri_series):
+    """
+    POSIX seconds (float64) of RR intervals: a columnar RRI channel from
+    parser_kdf.parse_kdf_columns / KdfFile, or a list of RR dicts.
+    """
+    if isinstance(rri_series, dict):
+        return channel_posix_times(rri_series)
+    return np.array([r['timestamp'].timestamp() for r in rri_series], dtype=np.double)
+
+
+def rri_values(rri_series):
+    """RR intervals (ms) of an RRI channel or list of RR dicts, as an array."""
+    if isinstance(rri_series, dict):
+        data = rri_series['data']
+        return data[data.dtype.names[0]]
+    return np.array([r['value'] for r in rri_series])
+
+
+def _nearest_numpy(rr_times, fit_times):
+    """
+    Vectorized nearest-neighbour search over sorted fit_times, with the same
+    tie-breaking as the native two-pointer (last of equally close indices).
+    """
+    k = np.searchsorted(fit_times, rr_times, side='right')
+    k_hi = np.minimum(k, fit_times.size - 1)
+    k_lo = np.maximum(k - 1, 0)
+    take_hi = (k < fit_times.size) & (
+        (k == 0) | (np.abs(fit_times[k_hi] - rr_times) <= np.abs(fit_times[k_lo] - rr_times)))
+    last_dup = np.searchsorted(fit_times, fit_times[k_hi], side='right') - 1
+    return np.where(take_hi, last_dup, k_lo).astype(np.uintp)
+
+
+def sync_rr_to_fit_matched(rr_times, fit_times, max_tolerance=None, backend=None):
+    """
+    Index-level sync of POSIX RR times onto POSIX FIT times.
+    Returns (out_idx, matched): the nearest FIT index per RR and a boolean
+    mask that is False where that FIT record is more than max_tolerance
+    seconds away (e.g. device pauses). Sorted input takes the native linear
+    path; unsorted RR or FIT times are handled by binary search.
+    backend: 'native', 'numpy' or None (native when available).
+    """
+    backend = _resolve_backend(backend)
+    rr_times = np.ascontiguousarray(rr_times, dtype=np.double)
+    fit_times = np.ascontiguousarray(fit_times, dtype=np.double)
+    out_idx = np.zeros(rr_times.size, dtype=np.uintp)
+    matched = np.zeros(rr_times.size, dtype=np.uint8)
+    if fit_times.size == 0:
+        return out_idx, matched.view(bool)
+
+    order = None
+    if np.any(fit_times[1:] < fit_times[:-1]):
+        order = np.argsort(fit_times, kind='stable')
+        fit_times = np.ascontiguousarray(fit_times[order])
+
+    tolerance = -1.0 if max_tolerance is None else float(max_tolerance)
+    if backend == 'native' and _has_tol:
+        _lib.sync_rr_to_fit_tol(rr_times, rr_times.size,
+                                fit_times, fit_times.size,
+                                tolerance, out_idx, matched)
+        matched = matched.view(bool)
+    else:
+        out_idx = _nearest_numpy(rr_times, fit_times)
+        matched = (tolerance < 0) | (np.abs(fit_times[out_idx] - rr_times) <= tolerance)
+
+    if order is not None:
+        out_idx = order[out_idx].astype(np.uintp)
+    return out_idx, matched
+
+
+class SyncedRow(Mapping):
+    """
+    Lazy, read-only view of one merged row: the matched FIT record's fields
+    plus 'rr_interval_ms' and 'rr_timestamp', resolved on access.
+    """
+
+    __slots__ = ('_table', '_row', '_record')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+        self._record = None
+
+    def _fit_record(self):
+        if self._record is None:
+            self._record = self._table.fit_record(self._row)
+        return self._record
+
+    def __getitem__(self, key):
+        if key == 'rr_interval_ms':
+            return self._table.rr_interval_ms[self._row].item()
+        if key == 'rr_timestamp':
+            return self._table.rr_timestamp(self._row)
+        return self._fit_record()[key]
+
+    def __iter__(self):
+        yield from self._fit_record()
+        yield 'rr_interval_ms'
+        yield 'rr_timestamp'
+
+    def __len__(self):
+        return len(self._fit_record()) + 2
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return f"SyncedRow({dict(self)!r})"
+
+
+class SyncedTable(Sequence):
+    """
+    Columnar result of sync_rr_to_fit_cpp, one row per matched RR interval:
+      fit_index       index of the matched FIT record (uintp ndarray)
+      rr_index        index of the RR interval in the input series
+      rr_interval_ms  RR values (ms), gathered by fancy indexing
+      rr_time         RR POSIX times (s), on the FIT clock when aligned
+      alignment       the align.ClockAlignment applied, or None
+      alignment_rejected  the estimate that was not applied (score below align.MIN_SCORE), or None
+      hrv_columns     per-record HRV metrics (hrv.record_columns), once computed
+    The FIT records and RR series are referenced, never copied. Indexing or
+    iterating yields lazy SyncedRow views for callers of the old list of dicts.
+    """
+
+    def __init__(self, fit_records, rri_series, fit_index, rr_index, rr_interval_ms, rr_time, alignment=None):
+        self.fit_records = fit_records
+        self.rri_series = rri_series
+        self.fit_index = fit_index
+        self.rr_index = rr_index
+        self.rr_interval_ms = rr_interval_ms
+        self.rr_time = rr_time
+        self.alignment = alignment
+        self.alignment_rejected = None
+        self.hrv_columns = None
+        self._rr_stamps = None
+
+    def __len__(self):
+        return self.fit_index.size
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [SyncedRow(self, i) for i in range(len(self))[row]]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("synced row index out of range")
+        return SyncedRow(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield SyncedRow(self, row)
+
+    def fit_record(self, row):
+        """The FIT record (dict) matched by one row; not copied for list input."""
+        j = int(self.fit_index[row])
+        if isinstance(self.fit_records, dict):
+            return column_record(self.fit_records, j)
+        return self.fit_records[j]
+
+    def column(self, name):
+        """A FIT field gathered per row (NaN/None where a record lacks it)."""
+        if isinstance(self.fit_records, dict):
+            return self.fit_records[name][self.fit_index]
+        return [self.fit_records[j].get(name) for j in self.fit_index.tolist()]
+
+    def rr_timestamp(self, row):
+        """The RR interval's datetime, as the input series reports it."""
+        i = int(self.rr_index[row])
+        if not isinstance(self.rri_series, dict):
+            return self.rri_series[i]['timestamp']
+        if self._rr_stamps is None:
+            self._rr_stamps = [r['timestamp'] for r in channel_records(self.rri_series)]
+        return self._rr_stamps[i]
+
+
+def sync_rr_to_fit_cpp(fit_records, rri_series, max_tolerance=None, backend=None, alignment=None):
+    """
+    fit_records: list of dicts, each record['timestamp'] is a datetime,
+                 or the columns of parser_fit.parse_fit_columns
+    rri_series:  list of dicts, each record['timestamp'] is datetime, record['value'] is RR ms,
+                 or a columnar RRI channel from parser_kdf
+    max_tolerance: seconds; RR intervals farther than this from every FIT
+                   record are left out instead of forced onto the nearest one
+    backend: 'native' (compiled), 'numpy' (searchsorted, identical results)
+             or None for native when it is available; both check that the
+             times are sorted and fall back to binary search when they are not
+    alignment: an align.ClockAlignment; RR times are moved onto the FIT
+               clock before syncing (the rr_time column holds corrected times)
+    Returns a SyncedTable; its rows read like the old merged dicts
+    (FIT fields + 'rr_interval_ms' + 'rr_timestamp').
+    """
+    backend = _resolve_backend(backend)
+    with stage('sync', backend=backend) as s:
+        # Build numpy arrays of POSIX times
+        rr_times  = rri_times(rri_series)
+        fit_times = fit_record_times(fit_records)
+        if alignment is not None:
+            rr_times = alignment.correct(rr_times)
+
+        # Without a tolerance every RR is matched (none when there are no FIT records)
+        out_idx, matched = sync_rr_to_fit_matched(rr_times, fit_times, max_tolerance, backend)
+        rr_index = np.flatnonzero(matched)
+        out_idx = out_idx[rr_index]
+
+        # Gather the RR columns; FIT records stay referenced through out_idx
+        s.count(records=int(fit_times.size), rr_intervals=int(rr_times.size), matched=int(rr_index.size))
+        return SyncedTable(fit_records, rri_series, out_idx, rr_index,
+                           rri_values(rri_series)[rr_index], rr_times[rr_index], alignment)
+
+
+SyncedBatch = namedtuple('SyncedBatch', ['fit_index', 'rr_index', 'rr_interval_ms', 'rr_time'])
+SyncedBatch.__doc__ = """
+Rows synced by one StreamingSync step, with the SyncedTable columns;
+fit_index and rr_index count from the start of their streams.
+"""
+
+
+class StreamingSync:
+    """
+    Two-pointer sync over FIT and RR timestamps that arrive in chunks (both
+    in time order). Only the FIT timestamps from the last one at or before
+    the next RR time on and the RR intervals that cannot be placed yet are
+    kept, so memory is bounded by the chunk sizes rather than the recording
+    length, even when one stream starts long before the other:
+
+        state = StreamingSync()
+        state.add_fit(fit_times)
+        state.add_rr(rr_times, rr_ms)
+        batch = state.sync()
+        ...
+        state.end_fit()
+        batch = state.sync()
+    """
+
+    def __init__(self, max_tolerance=None, backend=None):
+        self.max_tolerance = max_tolerance
+        self.backend = _resolve_backend(backend)
+        self.fit_final = False
+        self._fit = np.empty(0, dtype=np.double)   # FIT times from _fit_base on
+        self._fit_base = 0
+        self._cursor = 0
+        self._rr_times = np.empty(0, dtype=np.double)
+        self._rr_values = None
+        self._rr_base = 0                          # stream index of _rr_times[0]
+        self._rr_last = None                       # latest RR time added
+
+    @property
+    def pending(self):
+        """RR intervals waiting for FIT timestamps."""
+        return self._rr_times.size
+
+    def add_fit(self, fit_times):
+        """Appends POSIX FIT timestamps."""
+        if self.fit_final:
+            raise ValueError("FIT stream already ended.")
+        self._fit = np.concatenate((self._fit, np.asarray(fit_times, dtype=np.double)))
+        self._trim_fit()
+
+    def end_fit(self):
+        """Marks the FIT stream as complete, so every pending RR can be placed."""
+        self.fit_final = True
+
+    def add_rr(self, rr_times, rr_values):
+        """Appends POSIX RR times and their values (ms)."""
+        rr_values = np.asarray(rr_values)
+        rr_times = np.asarray(rr_times, dtype=np.double)
+        self._rr_times = np.concatenate((self._rr_times, rr_times))
+        self._rr_values = rr_values if self._rr_values is None else np.concatenate((self._rr_values, rr_values))
+        if rr_times.size:
+            self._rr_last = rr_times[-1]
+        self._trim_fit()
+
+    def _trim_fit(self):
+        # FIT times before the last one at or before the next RR time can never be nearest
+        # to a later RR (ties go to the later index); before any RR arrives nothing is known
+        if self.pending:
+            next_rr = self._rr_times[0]
+        elif self._rr_last is not None:
+            next_rr = self._rr_last
+        else:
+            return
+        k = int(np.searchsorted(self._fit, next_rr, side='right')) - 1
+        if k > 0:
+            self._fit = self._fit[k:].copy()
+            self._fit_base += k
+            self._cursor = max(self._cursor - k, 0)
+
+    def sync(self):
+        """Places every RR interval that can be placed; returns a SyncedBatch."""
+        n = self.pending
+        if self._fit.size == 0:
+            # Without any FIT timestamps nothing is matched (as sync_rr_to_fit_cpp)
+            done = n if self.fit_final else 0
+            out_idx = np.empty(0, dtype=np.uintp)
+            keep = np.zeros(0, dtype=bool)
+            cursor = 0
+        else:
+            if self.backend == 'native' and _has_stream:
+                out_idx = np.empty(n, dtype=np.uintp)
+                cursor = ctypes.c_size_t(self._cursor)
+                done = _lib.sync_rr_to_fit_stream(self._rr_times, n, self._fit, self._fit.size,
+                                                  int(self.fit_final), ctypes.byref(cursor), out_idx)
+                if done < 0:
+                    raise ValueError("Invalid streaming sync state.")
+                out_idx = out_idx[:done]
+                cursor = cursor.value
+            else:
+                done, out_idx = _stream_numpy(self._rr_times, self._fit, self.fit_final)
+                cursor = int(out_idx[-1]) if done else self._cursor
+            if self.max_tolerance is None:
+                keep = np.ones(done, dtype=bool)
+            else:
+                keep = np.abs(self._fit[out_idx] - self._rr_times[:done]) <= self.max_tolerance
+
+        rr_index = np.flatnonzero(keep)
+        batch = SyncedBatch(out_idx[rr_index] + np.uintp(self._fit_base),
+                            rr_index + self._rr_base,
+                            np.empty(0) if self._rr_values is None else self._rr_values[rr_index],
+                            self._rr_times[rr_index])
+
+        # Drop what no later RR can need
+        self._cursor = cursor
+        if done:
+            self._rr_times = self._rr_times[done:].copy()
+            self._rr_values = self._rr_values[done:].copy()
+            self._rr_base += done
+        self._trim_fit()
+        return batch
+
+
+def _stream_numpy(rr_times, fit_window, fit_final):
+    # NumPy stand-in for sync_rr_to_fit_stream (expects sorted RR times):
+    # an RR is placed once a FIT timestamp past its nearest one has arrived
+    n = rr_times.size
+    if not fit_final:
+        last = np.searchsorted(fit_window, fit_window[-1], side='left')
+        waiting = np.flatnonzero(np.searchsorted(fit_window, rr_times, side='right') >= last)
+        if waiting.size:
+            n = int(waiting[0])
+    return n, _nearest_numpy(rr_times[:n], fit_window)
+
+
+def sync_rr_to_fit_stream(fit_chunks, rri_chunks, max_tolerance=None, backend=None, alignment=None):
+    """
+    Streaming sync_rr_to_fit_cpp. fit_chunks yields FIT timestamp chunks
+    (e.g. parser_fit.iter_fit_timestamps, or lists of record dicts) and
+    rri_chunks yields RRI chunks (e.g. parser_kdf.iter_kdf_chunks); both in
+    time order. Chunks are pulled only as needed and a SyncedBatch is yielded
+    as soon as rows are placed; concatenated, the batches hold the columns
+    sync_rr_to_fit_cpp returns for the whole inputs. alignment (estimated
+    beforehand) corrects each RR chunk's times as in sync_rr_to_fit_cpp.
+    """
+    state = StreamingSync(max_tolerance, backend)
+    fit_chunks = iter(fit_chunks)
+    for rri_chunk in rri_chunks:
+        rr_times = rri_times(rri_chunk)
+        if alignment is not None:
+            rr_times = alignment.correct(rr_times)
+        state.add_rr(rr_times, rri_values(rri_chunk))
+        while True:
+            batch = state.sync()
+            if batch.fit_index.size:
+                yield batch
+            if not state.pending or state.fit_final:
+                break
+            fit_chunk = next(fit_chunks, None)
+            if fit_chunk is None:
+                state.end_fit()
+            else:
+                state.add_fit(fit_record_times(fit_chunk))
@@ -1,119 +1,536 @@
 import csv
-import subprocess
+import multiprocessing
+import os
+import struct
 import tempfile
+import threading
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from divider import split_multisport_fit
+import numpy as np
+from divider import ParsedActivity
+from csvtool_worker import FitCsvToolWorker, get_worker
+from fit_encoder import FIT_PROTOCOL_VERSION, FitRecordEncoder, encode_message, write_fit_file
+from instrument import file_size, stage
+from progress import NULL_PROGRESS
+from fit_native import FIT_EPOCH, MESG_RECORD, crc16, decode_records, iter_message_stream, read_file_header
 
 from datetime import datetime
-from typing import Callable
-from fitparse import FitFile as FitParseFile
-from fit_tool.fit_file import FitFile as FitToolFile
-from fit_tool.fit_file_builder import FitFileBuilder
-from fit_tool.profile.messages.file_id_message import FileIdMessage
-from fit_tool.profile.profile_type import FileType, Manufacturer
-from fit_tool.profile.messages.record_message import RecordMessage
-from fit_tool.profile.messages.event_message import EventMessage
+from typing import Callable, Iterable
 
 
 def write_fit_with_rr(input_fit: str,
                       merged: list[dict],
                       jar_path: str,
-                      output_fit: str):
+                      output_fit: str,
+                      worker: FitCsvToolWorker | None = None):
     """
     Embeds RR intervals into a new .fit file via Garmin's FitCSVTool.jar.
+    Both conversions run on a persistent FitCSVTool worker (the shared one
+    for jar_path unless given), so the JVM is only started once per process.
+    Each RR interval is added as an `hrv` row right after the record row
+    with the FIT 'timestamp' it was synced to.
     """
-    orig_csv = tempfile.mktemp(suffix=".csv")
-    subprocess.run([
-        "java", "-jar", jar_path,
-        "-o", orig_csv,
-        input_fit
-    ], check=True)
-
-    rr_map = {rec['rr_timestamp'].isoformat(): rec['rr_interval_ms'] for rec in merged}
-    temp_csv = tempfile.mktemp(suffix="_rr.csv")
-    with open(orig_csv, newline='') as inp, open(temp_csv, 'w', newline='') as outp:
-        reader = csv.DictReader(inp)
-        fieldnames = reader.fieldnames + ["rr_interval_ms"]
-        writer = csv.DictWriter(outp, fieldnames=fieldnames)
-        writer.writeheader()
+    if worker is None:
+        worker = get_worker(jar_path)
+
+    with stage('write_fit_with_rr', output=str(output_fit)) as s:
+        orig_csv = _temp_path(".csv")
+        temp_csv = _temp_path("_rr.csv")
+        try:
+            with stage('csv_export') as sub:
+                worker.convert(["-b", input_fit, orig_csv], output=orig_csv)
+                sub.count(bytes_read=file_size(input_fit), bytes_written=file_size(orig_csv))
+
+            with stage('merge') as sub:
+                rr_map = {}
+                for rec in merged:
+                    ts = int(rec['timestamp'].timestamp()) - FIT_EPOCH
+                    rr_map.setdefault(ts, []).append(rec['rr_interval_ms'])
+                rows = _merge_rr_csv(orig_csv, temp_csv, rr_map)
+                sub.count(rows=rows, rr_intervals=len(merged), bytes_written=file_size(temp_csv))
+
+            with stage('csv_import') as sub:
+                worker.convert(["-c", temp_csv, output_fit], output=output_fit)
+                sub.count(bytes_read=file_size(temp_csv), bytes_written=file_size(output_fit))
+            s.count(rr_intervals=len(merged), bytes_written=file_size(output_fit))
+        finally:
+            for f in (orig_csv, temp_csv):
+                try:
+                    Path(f).unlink()
+                except OSError:
+                    pass
+
+
+def _temp_path(suffix):
+    # Closed, empty temp file for FitCSVTool to overwrite
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def _merge_rr_csv(orig_csv, temp_csv, rr_map):
+    """
+    Copies a FitCSVTool CSV, adding `hrv` data rows (RR in seconds, up to
+    HRV_VALUES_PER_MESG per row) after the first record row of each FIT
+    timestamp in rr_map. Rows are Type, Local Number, Message and then
+    Field N / Value N / Units N triples. Returns the rows written.
+    """
+    rows = 0
+    with open(orig_csv, newline='', encoding='utf-8-sig') as inp, open(temp_csv, 'w', newline='') as outp:
+        reader = csv.reader(inp)
+        writer = csv.writer(outp)
+        header = next(reader)
+        writer.writerow(header)
         for row in reader:
-            row["rr_interval_ms"] = rr_map.get(row.get("timestamp", ''), "")
             writer.writerow(row)
+            rows += 1
+            if row[:1] != ['Data'] or row[2:3] != ['record']:
+                continue
+            ts_value = None
+            for i in range(3, len(row) - 1, 3):
+                if row[i].strip().lower() == 'timestamp':
+                    raw = row[i + 1]
+                    ts_value = int(raw.split('.')[0]) if raw else None
+                    break
+            rr = rr_map.pop(ts_value, None)
+            for k in range(0, len(rr or ()), HRV_VALUES_PER_MESG):
+                times = '|'.join(f"{v / 1000:.3f}" for v in rr[k:k + HRV_VALUES_PER_MESG])
+                hrv_row = ['Data', str(HRV_LOCAL_TYPE), 'hrv', 'time', times, 's']
+                writer.writerow(hrv_row + [''] * (len(header) - len(hrv_row)))
+                rows += 1
+    return rows
+
+
+HRV_MESG = 78
+# hrv.time is a uint16[5] array in seconds with scale 1000, i.e. raw RR milliseconds
+HRV_VALUES_PER_MESG = 5
+HRV_INVALID = 0xFFFF
+# Local message type borrowed for hrv messages; the source definition is restored after use
+HRV_LOCAL_TYPE = 15
+_HRV_DEFINITION = bytes([0x40 | HRV_LOCAL_TYPE, 0, 0]) + struct.pack('<HB', HRV_MESG, 1) + bytes([0, 2 * HRV_VALUES_PER_MESG, 0x84])
+
+# Per-record columns (hrv.record_columns) are written as float32 developer fields of the records
+MESG_FIELD_DESCRIPTION = 206
+MESG_DEVELOPER_DATA_ID = 207
+# Developer data index of the columns; high, so it does not clash with the source's own developers
+DEV_DATA_INDEX = 254
+DEV_FLOAT32 = 0x88
+DEV_INVALID = 0xFFFFFFFF
+DEV_NAME_SIZE = 16
+DEV_UNITS_SIZE = 8
+_DEV_ID_DEFINITION = (bytes([0x40 | HRV_LOCAL_TYPE, 0, 0]) + struct.pack('<HB', MESG_DEVELOPER_DATA_ID, 1)
+                      + bytes([3, 1, 0x02]))
+# developer_data_index, field_definition_number, fit_base_type_id, field_name, units
+_DEV_FIELD_DEFINITION = (bytes([0x40 | HRV_LOCAL_TYPE, 0, 0]) + struct.pack('<HB', MESG_FIELD_DESCRIPTION, 5)
+                         + bytes([0, 1, 0x02, 1, 1, 0x02, 2, 1, 0x02, 3, DEV_NAME_SIZE, 0x07, 8, DEV_UNITS_SIZE, 0x07]))
+
+
+def _fit_string(text, size):
+    # Null-terminated, null-padded FIT string field
+    return text.encode('utf-8')[:size - 1].ljust(size, b'\0')
+
+
+class HrvFitWriter:
+    """
+    Streams the messages of input_fit into output_fit in-process and injects
+    standard `hrv` messages (RR intervals) right after the record each RR was
+    synced to. The source is read incrementally, and the header data size,
+    header CRC and file CRC are recomputed on close(); no temp files or
+    external tools are involved.
 
-    subprocess.run([
-        "java", "-jar", jar_path,
-        "-t", "fit",
-        "-o", output_fit,
-        temp_csv
-    ], check=True)
+        with HrvFitWriter(input_fit, output_fit) as writer:
+            writer.add(record_indices, rr_ms)
 
-    for f in (orig_csv, temp_csv):
+    progress (a progress.ProgressReporter) gets the number of records copied.
+    record_columns ({ name: one value per source record }, e.g. from
+    hrv.record_columns) are added to every record as float32 developer
+    fields, NaN written as invalid.
+    """
+
+    # Records copied between progress updates
+    PROGRESS_EVERY = 4096
+
+    def __init__(self, input_fit: str, output_fit: str, progress=NULL_PROGRESS, record_columns=None):
+        self.input_fit = input_fit
+        self._progress = progress
+        self._src = open(input_fit, 'rb')
+        head = self._src.read(14)
+        try:
+            self._header_size, data_size = read_file_header(head, complete=False)
+            # Records of later files would be counted but never copied, losing their RR
+            if os.fstat(self._src.fileno()).st_size > self._header_size + data_size + 2:
+                raise ValueError(f"{input_fit} is a chained FIT file; only single FIT files are supported.")
+        except ValueError:
+            self._src.close()
+            raise
+        self._header = head[:self._header_size]
+        self._src.seek(0)
+        self._messages = iter_message_stream(self._src, chained=False)
+        self._record_count = 0
+        self._pending = {}
+        self._source_def = None       # source definition currently owning HRV_LOCAL_TYPE
+        self._borrowed = None         # our definition in HRV_LOCAL_TYPE instead, or None
+        self._columns = dict(record_columns or {})
+        self._dev_rows = {}           # endianness -> per-record developer field bytes
+        self._dev_described = False
+        self._record_timestamps = None
+        self.output_fit = output_fit
+        self.rr_written = 0
+
+        self._out = open(output_fit, 'w+b')
+        self._out.write(self._header)
+
+    @property
+    def record_timestamps(self):
+        """FIT-epoch timestamps of the source records, in file order."""
+        if self._record_timestamps is None:
+            self._record_timestamps = decode_records(self.input_fit, ('timestamp',))['timestamp']
+        return self._record_timestamps
+
+    @property
+    def records_copied(self):
+        """Source records written so far."""
+        return self._record_count
+
+    def add(self, record_indices: Iterable[int], rr_ms: Iterable[float]):
+        """
+        Queues RR intervals (ms) for the given source record indices. Records
+        before the highest index are written out immediately, so indices are
+        expected in non-decreasing order; late ones are emitted in place.
+        """
+        last = None
+        for idx, rr in zip(record_indices, rr_ms):
+            idx = int(idx)
+            if idx < self._record_count:
+                self._write_hrv([rr])
+            else:
+                self._pending.setdefault(idx, []).append(rr)
+            last = idx if last is None else max(last, idx)
+        if last is not None:
+            self._copy_until(last)
+
+    def _copy_until(self, stop):
+        # Copies source messages until record `stop` is next (everything when None)
+        if stop is not None and self._record_count >= stop:
+            return
+        for msg, data in self._messages:
+            is_record = msg.definition.global_num == MESG_RECORD
+            if msg.is_definition:
+                if is_record and self._columns:
+                    data = self._record_definition(msg.definition, data)
+                if msg.local_type == HRV_LOCAL_TYPE:
+                    self._source_def = data
+                    self._borrowed = None
+            elif msg.local_type == HRV_LOCAL_TYPE and self._borrowed is not None:
+                self._out.write(self._source_def)
+                self._borrowed = None
+            self._out.write(data)
+
+            if not msg.is_definition and is_record:
+                if self._columns:
+                    self._out.write(self._dev_values(msg.definition.big_endian))
+                rr = self._pending.pop(self._record_count, None)
+                self._record_count += 1
+                if not self._record_count % self.PROGRESS_EVERY:
+                    self._progress.update(self._record_count)
+                if rr:
+                    self._write_hrv(rr)
+                if stop is not None and self._record_count >= stop:
+                    return
+
+    def _borrow(self, definition):
+        # Puts one of our definitions into HRV_LOCAL_TYPE (restored on the source's next use)
+        if self._borrowed is not definition:
+            self._out.write(definition)
+            self._borrowed = definition
+
+    def _record_definition(self, definition, data):
+        # The record definition with the columns appended as developer fields
+        if not self._dev_described:
+            self._describe_columns()
+        n = len(definition.fields)
+        old_dev = data[6 + 3 * n + 1:] if data[0] & 0x20 else b''
+        new_dev = b''.join(bytes([k, 4, DEV_DATA_INDEX]) for k in range(len(self._columns)))
+        return (bytes([data[0] | 0x20]) + data[1:6 + 3 * n]
+                + bytes([len(definition.dev_fields) + len(self._columns)]) + old_dev + new_dev)
+
+    def _describe_columns(self):
+        # developer_data_id and one field_description per column, before the first record definition
+        from hrv import METRICS
+
+        self._borrow(_DEV_ID_DEFINITION)
+        self._out.write(bytes([HRV_LOCAL_TYPE, DEV_DATA_INDEX]))
+        self._borrow(_DEV_FIELD_DEFINITION)
+        for k, name in enumerate(self._columns):
+            self._out.write(bytes([HRV_LOCAL_TYPE, DEV_DATA_INDEX, k, DEV_FLOAT32])
+                            + _fit_string(name, DEV_NAME_SIZE) + _fit_string(METRICS.get(name, ''), DEV_UNITS_SIZE))
+        self._dev_described = True
+
+    def _dev_values(self, big_endian):
+        # Developer field bytes of the record being copied
+        rows = self._dev_rows.get(big_endian)
+        if rows is None:
+            values = np.column_stack([np.asarray(v, dtype=np.double) for v in self._columns.values()])
+            raw = values.astype('>f4' if big_endian else '<f4').view('>u4' if big_endian else '<u4')
+            raw[~np.isfinite(values)] = DEV_INVALID
+            rows = self._dev_rows[big_endian] = raw.tobytes()
+        size = 4 * len(self._columns)
+        row = rows[self._record_count * size:(self._record_count + 1) * size]
+        # Records past the columns (a mismatched input) get invalid values
+        return row or b'\xff' * size
+
+    def _write_hrv(self, rr_ms):
+        self._borrow(_HRV_DEFINITION)
+        header = bytes([HRV_LOCAL_TYPE])
+        for i in range(0, len(rr_ms), HRV_VALUES_PER_MESG):
+            chunk = [min(int(round(v)), HRV_INVALID - 1) for v in rr_ms[i:i + HRV_VALUES_PER_MESG]]
+            chunk += [HRV_INVALID] * (HRV_VALUES_PER_MESG - len(chunk))
+            self._out.write(header + struct.pack(f'<{HRV_VALUES_PER_MESG}H', *chunk))
+        self.rr_written += len(rr_ms)
+
+    def close(self):
+        if self._out.closed:
+            return
         try:
-            Path(f).unlink()
-        except OSError:
-            pass
-    print(f"Wrote new FIT with RR to {output_fit}")
+            self._copy_until(None)
+        finally:
+            self._src.close()
+        for idx in sorted(self._pending):
+            # RR synced past the last source record
+            self._write_hrv(self._pending.pop(idx))
+
+        out = self._out
+        data_size = out.tell() - self._header_size
+        header = bytearray(self._header)
+        header[4:8] = struct.pack('<I', data_size)
+        if self._columns and header[1] >> 4 < 2:
+            # Developer fields need protocol 2.x; strict decoders reject them in a 1.x file
+            header[1] = FIT_PROTOCOL_VERSION
+        if self._header_size >= 14:
+            header[12:14] = struct.pack('<H', crc16(header[:12]))
+        out.seek(0)
+        out.write(header)
+
+        # File CRC over header + data, re-read in chunks to keep memory flat
+        out.seek(0)
+        crc = 0
+        while chunk := out.read(1 << 20):
+            crc = crc16(chunk, crc)
+        out.write(struct.pack('<H', crc))
+        out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_fit_with_hrv(input_fit: str,
+                       merged,
+                       output_fit: str,
+                       progress=NULL_PROGRESS,
+                       record_columns=None):
+    """
+    Embeds RR intervals into a new .fit file as `hrv` messages, in-process.
+    merged is the SyncedTable from sync_rr_to_fit_cpp (its fit_index picks the
+    record each RR is written after) or a list of merged dicts, matched to
+    records by their FIT 'timestamp'. progress reports a 'write' stage.
+    record_columns (e.g. hrv.record_columns(merged)) become developer fields
+    of the records.
+    """
+    with stage('write_fit_with_hrv', output=str(output_fit)) as s, \
+            HrvFitWriter(input_fit, output_fit, progress, record_columns) as writer:
+        if hasattr(merged, 'fit_index'):
+            fit_records = merged.fit_records
+            progress.begin('write', total=len(fit_records['timestamp'] if isinstance(fit_records, dict) else fit_records))
+            writer.add(merged.fit_index, merged.rr_interval_ms.tolist())
+        else:
+            progress.begin('write', total=int(writer.record_timestamps.size))
+            first_index = {}
+            for i, ts in enumerate(writer.record_timestamps.tolist()):
+                first_index.setdefault(ts, i)
+            indices, values = [], []
+            for rec in merged:
+                idx = first_index.get(int(rec['timestamp'].timestamp()) - FIT_EPOCH)
+                if idx is not None:
+                    indices.append(idx)
+                    values.append(rec['rr_interval_ms'])
+            writer.add(indices, values)
+        writer.close()
+        s.count(rr_intervals=writer.rr_written, records=writer.records_copied,
+                bytes_read=file_size(input_fit), bytes_written=file_size(output_fit))
+    progress.end()
+
+
+def write_fit_with_hrv_stream(input_fit: str,
+                              batches: Iterable,
+                              output_fit: str):
+    """
+    Streaming write_fit_with_hrv: batches are the SyncedBatch chunks of
+    sync.sync_rr_to_fit_stream, written as they arrive. Returns the number
+    of (records, RR intervals) written.
+    """
+    with stage('write_fit_with_hrv_stream', output=str(output_fit)) as s, \
+            HrvFitWriter(input_fit, output_fit) as writer:
+        for batch in batches:
+            writer.add(batch.fit_index, batch.rr_interval_ms.tolist())
+        writer.close()
+        s.count(rr_intervals=writer.rr_written, records=writer.records_copied,
+                bytes_read=file_size(input_fit), bytes_written=file_size(output_fit))
+    return writer.records_copied, writer.rr_written
+
+
+# Activity being split, inherited by forked encoder processes instead of pickled
+_split_activity = None
+_split_lock = threading.Lock()
+
+
+def _split_messages(activity, output):
+    # Messages of one split output: ('segment', session index) or ('transition', index)
+    kind, index = output
+    if kind == 'segment':
+        seg = activity.sessions[index]
+        return activity.segment_records(seg["start"], seg["end"])
+    return [activity.transition_messages[index]]
+
+
+def _build_fit_bytes(msgs):
+    # fit_tool is only needed by this encoder; importing it costs more than the rest of the module
+    from fit_tool.fit_file_builder import FitFileBuilder
+    from fit_tool.profile.messages.file_id_message import FileIdMessage
+    from fit_tool.profile.profile_type import FileType, Manufacturer
+
+    fid = FileIdMessage()
+    fid.type          = FileType.ACTIVITY
+    fid.manufacturer  = Manufacturer.DEVELOPMENT.value
+    fid.product       = 0
+    fid.time_created  = round(datetime.now().timestamp() * 1000)
+    fid.serial_number = 0x12345678
+
+    builder = FitFileBuilder(auto_define=True, min_string_size=50)
+    builder.add(fid)
+    builder.add_all(msgs)
+    return builder.build().to_bytes()
+
+
+def _encode_split_output(output):
+    # Pool worker: encodes one output of the inherited _split_activity
+    return _build_fit_bytes(_split_messages(_split_activity, output))
+
+
+def _encode_split_outputs(activity, outputs, workers):
+    """
+    Yields the encoded bytes of each output, in order. Outputs are encoded
+    on a forked process pool (the activity is inherited, not pickled) when
+    there is more than one and fork is available; otherwise one by one.
+    """
+    global _split_activity
+    workers = min(workers or os.cpu_count() or 1, len(outputs))
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        for output in outputs:
+            yield _build_fit_bytes(_split_messages(activity, output))
+        return
+
+    # Imported and decoded before forking, so the workers inherit fit_tool and its messages
+    import fit_tool.fit_file_builder  # noqa: F401
+    activity.records
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    try:
+        # Worker processes are forked while submitting, so they all see this activity
+        with _split_lock:
+            _split_activity = activity
+            try:
+                futures = [pool.submit(_encode_split_output, output) for output in outputs]
+            finally:
+                _split_activity = None
+        for future in futures:
+            yield future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def _encode_split_outputs_fast(input_fit, activity, outputs):
+    """
+    Yields each output for the fast encoder: record segments as message
+    lists from one shared FitRecordEncoder (definitions built once per field
+    layout), transitions as their source event message. fit_tool is not used.
+    """
+    encoder = FitRecordEncoder(input_fit)
+    for kind, index in outputs:
+        if kind == 'segment':
+            seg = activity.sessions[index]
+            yield encoder.encode(seg["start"], seg["end"])
+        else:
+            yield encode_message(activity.transitions[index])
 
 
 def write_split_fits_pure_python(
     input_fit:      str,
     output_fit_path:str,
-    on_progress: Callable[[], None] = lambda: None
+    on_progress: Callable[[Path], None] = lambda path: None,
+    activity: ParsedActivity | None = None,
+    workers: int | None = None,
+    encoder: str = 'fit_tool'
 ):
     """
     Splits a multisport .fit file into separate files for each sport segment
     and each transition event. Ensures unique filenames by appending a counter
-    if a name is reused.
+    if a name is reused. Pass an already decoded ParsedActivity to avoid
+    parsing input_fit again. Outputs are encoded on up to `workers` processes
+    (default: CPU count; 1 encodes serially) and written in order;
+    on_progress is called with the path of each file once it is written.
+    encoder='fast' writes segments with fit_encoder.FitRecordEncoder instead
+    of fit_tool: records keep their source field values, in bulk.
     """
-    result      = split_multisport_fit(input_fit)
-    sessions    = result["sports"]
-    transitions = result.get("transitions", [])
-
-    ft = FitToolFile.from_file(input_fit)
-    all_records = [rw.message for rw in ft.records if isinstance(rw.message, RecordMessage)]
+    if activity is None:
+        activity = ParsedActivity(input_fit)
+    sessions    = activity.sessions
+    transitions = activity.transitions
 
     out_p   = Path(output_fit_path)
     out_dir = out_p.parent
     base    = out_p.stem
     ext     = out_p.suffix or ".fit"
 
+    # Every output in write order, with its suffix
+    outputs, suffixes = [], []
+    for i, seg in enumerate(sessions):
+        outputs.append(('segment', i))
+        suffixes.append(str(seg["sport"]).lower().replace(" ", "_"))
+    for idx in range(1, len(transitions) + 1):
+        outputs.append(('transition', idx - 1))
+        suffixes.append(f"transition{idx}")
+
     # Track how many times each suffix has been used
     name_counts = {}
-
-    def build_and_write(msgs, raw_suffix):
+    out_files = []
+    for raw_suffix in suffixes:
         # Increment count
         count = name_counts.get(raw_suffix, 0) + 1
         name_counts[raw_suffix] = count
         # Determine final suffix
         suffix = f"{raw_suffix}{count}" if count > 1 else raw_suffix
-        out_file = out_dir / f"{base}_{suffix}{ext}"
-
-        fid = FileIdMessage()
-        fid.type          = FileType.ACTIVITY
-        fid.manufacturer  = Manufacturer.DEVELOPMENT.value
-        fid.product       = 0
-        fid.time_created  = round(datetime.now().timestamp() * 1000)
-        fid.serial_number = 0x12345678
-
-        builder = FitFileBuilder(auto_define=True, min_string_size=50)
-        builder.add(fid)
-        builder.add_all(msgs)
-        new_fit = builder.build()
-        new_fit.to_file(str(out_file))
-        print(f"Wrote: {out_file}")
-
-    # Write sport segments
-    for seg in sessions:
-        start_ms = int(seg["start"].timestamp() * 1000)
-        end_ms   = int(seg["end"].timestamp() * 1000) if seg["end"] else None
-        recs = [r for r in all_records if r.timestamp >= start_ms and (end_ms is None or r.timestamp < end_ms)]
-        raw_suffix = str(seg["sport"]).lower().replace(" ", "_")
-        build_and_write(recs, raw_suffix)
-        on_progress()
-
-    # Write transitions
-    for idx, trans_msg in enumerate(transitions, start=1):
-        raw_suffix = f"transition{idx}"
-        build_and_write([trans_msg], raw_suffix)
-        on_progress()
+        out_files.append(out_dir / f"{base}_{suffix}{ext}")
+
+    # Encode in parallel, write in order
+    if encoder == 'fast':
+        encoded = _encode_split_outputs_fast(input_fit, activity, outputs)
+    elif encoder == 'fit_tool':
+        encoded = _encode_split_outputs(activity, outputs, workers)
+    else:
+        raise ValueError(f"Unknown encoder: {encoder}")
+    with stage('write_split', encoder=encoder) as s:
+        try:
+            for out_file, data in zip(out_files, encoded):
+                if isinstance(data, list):
+                    write_fit_file(out_file, data)
+                else:
+                    with open(out_file, 'wb') as f:
+                        f.write(data)
+                s.count(outputs=1, bytes_written=file_size(out_file))
+                on_progress(out_file)
+        finally:
+            encoded.close()